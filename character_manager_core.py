@@ -3,31 +3,45 @@
 """
 
 import os
+import stat
+import threading
 import time
-from typing import Dict, List, Optional, Tuple, Set
-from pathlib import Path
-from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 import logging
 
 from character_models import (
     CharacterInfo, ValidationResult, CharacterError, 
     CharacterNotFoundError, CharacterValidationError,
-    CharacterFileError, is_valid_audio_file, 
+    CharacterFileError, CharacterConfig, is_valid_audio_file, 
     is_valid_image_file, is_valid_video_file,
-    sanitize_character_name, get_file_size_mb
+    sanitize_character_name, bytes_to_mb,
+    AUDIO_EXTENSIONS, IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, get_file_extension
 )
 
 
+NEGATIVE_CACHE_TTL = 30.0  # 验证失败结果的缓存时间（秒）
+
+
 @dataclass
 class CacheEntry:
-    """缓存条目"""
-    character_info: CharacterInfo
+    """
+    缓存条目（timestamp 必须与 clock 使用同一时间基准）
+
+    character_info 为 None 时是负缓存，validation_result 记录验证失败的原因。
+    dir_mtime_ns 记录验证时角色目录的修改时间（目录不存在时为0），
+    角色目录发生变化时条目立即失效。
+    """
+    character_info: Optional[CharacterInfo]
     timestamp: float
     ttl: float = 300.0  # 5分钟缓存时间
+    clock: Callable[[], float] = field(default=time.monotonic, repr=False, compare=False)
+    validation_result: Optional[ValidationResult] = None
+    dir_mtime_ns: int = 0
     
     def is_expired(self) -> bool:
         """检查缓存是否过期"""
-        return time.time() - self.timestamp > self.ttl
+        return self.clock() - self.timestamp > self.ttl
 
 
 class CharacterManager:
@@ -36,10 +50,18 @@ class CharacterManager:
     def __init__(self, characters_dir: str = "characters"):
         self.characters_dir = characters_dir
         self.characters: Dict[str, CharacterInfo] = {}
-        self.cache: Dict[str, CacheEntry] = {}
-        self.supported_audio_formats = {'.mp3', '.wav', '.m4a', '.flac', '.aac', '.ogg'}
-        self.supported_image_formats = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.gif'}
-        self.supported_video_formats = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.webm'}
+        self.cache: Dict[Tuple[str, int], CacheEntry] = {}
+        # 保护缓存读写，并避免多个线程同时未命中时重复扫描同一角色
+        self._lock = threading.RLock()
+        self.supported_audio_formats = AUDIO_EXTENSIONS
+        self.supported_image_formats = IMAGE_EXTENSIONS
+        self.supported_video_formats = VIDEO_EXTENSIONS
+        # 扩展名 -> found_files 分类，供单次扫描目录时分组使用
+        self._extension_types: Dict[str, str] = {
+            **{ext: 'audio' for ext in self.supported_audio_formats},
+            **{ext: 'images' for ext in self.supported_image_formats},
+            **{ext: 'videos' for ext in self.supported_video_formats},
+        }
         
         # 设置日志
         self.logger = logging.getLogger(__name__)
@@ -56,25 +78,50 @@ class CharacterManager:
             except OSError as e:
                 raise CharacterError(f"无法创建角色目录 '{self.characters_dir}': {e}")
     
-    def _get_cache_key(self, character_name: str) -> str:
-        """获取缓存键"""
-        return f"{character_name}_{os.path.getmtime(self.characters_dir) if os.path.exists(self.characters_dir) else 0}"
+    def _get_cache_key(self, character_name: str) -> Tuple[str, int]:
+        """获取缓存键：(角色名称, 角色根目录修改时间)"""
+        return character_name, self._dir_mtime_ns(self.characters_dir)
+    
+    def _dir_mtime_ns(self, path: str) -> int:
+        """获取目录修改时间，目录不存在时返回0"""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
     
-    def _cache_character(self, character_info: CharacterInfo):
+    def _cache_character(self, cache_key: Tuple[str, int], character_info: CharacterInfo):
         """缓存角色信息"""
-        cache_key = self._get_cache_key(character_info.name)
-        self.cache[cache_key] = CacheEntry(character_info, time.time())
+        validation_result = character_info.validation_result
+        with self._lock:
+            self.cache[cache_key] = CacheEntry(
+                character_info, time.monotonic(), validation_result=validation_result,
+                dir_mtime_ns=validation_result.dir_mtime_ns
+            )
     
-    def _get_cached_character(self, character_name: str) -> Optional[CharacterInfo]:
-        """从缓存获取角色信息"""
-        cache_key = self._get_cache_key(character_name)
-        if cache_key in self.cache:
-            entry = self.cache[cache_key]
-            if not entry.is_expired():
-                return entry.character_info
-            else:
+    def _cache_failure(self, cache_key: Tuple[str, int], validation_result: ValidationResult):
+        """缓存验证失败的结果（较短的TTL），避免反复扫描无效角色"""
+        with self._lock:
+            self.cache[cache_key] = CacheEntry(
+                None, time.monotonic(), ttl=NEGATIVE_CACHE_TTL,
+                validation_result=validation_result, dir_mtime_ns=validation_result.dir_mtime_ns
+            )
+    
+    def _get_cached_entry(self, cache_key: Tuple[str, int]) -> Optional[CacheEntry]:
+        """从缓存获取有效的条目（包括负缓存）"""
+        with self._lock:
+            entry = self.cache.get(cache_key)
+            if entry is None:
+                return None
+            
+            # 角色目录发生变化（例如删除了音频或补充了缺少的文件）时立即失效；
+            # 缓存键中的根目录修改时间只反映角色的增删，反映不了角色目录内的变化
+            stale = entry.dir_mtime_ns != self._dir_mtime_ns(
+                os.path.join(self.characters_dir, entry.validation_result.character_name)
+            )
+            if stale or entry.is_expired():
                 del self.cache[cache_key]
-        return None
+                return None
+            return entry
     
     def _sanitize_path(self, path: str) -> str:
         """清理路径，防止路径遍历攻击"""
@@ -91,23 +138,32 @@ class CharacterManager:
         except (OSError, ValueError) as e:
             raise CharacterError(f"无效路径: {path} - {e}")
     
-    def _find_files_by_type(self, directory: str, extensions: Set[str]) -> List[str]:
-        """在目录中查找指定扩展名的文件"""
-        if not os.path.exists(directory):
-            return []
-        
-        found_files = []
+    def _classify_dir(self, directory: str) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        单次扫描目录，把媒体文件按类型分组
+
+        Returns:
+            {'audio' | 'images' | 'videos': 按路径排序的 (路径, 字节数) 列表}
+        """
+        classified: Dict[str, List[Tuple[str, int]]] = {'audio': [], 'images': [], 'videos': []}
         try:
             with os.scandir(directory) as entries:
                 for entry in entries:
-                    if entry.is_file():
-                        ext = os.path.splitext(entry.name)[1].lower()
-                        if ext in extensions:
-                            found_files.append(entry.path)
+                    file_type = self._extension_types.get(get_file_extension(entry.name))
+                    if file_type is None or not entry.is_file():
+                        continue
+                    try:
+                        classified[file_type].append((entry.path, entry.stat().st_size))
+                    except OSError:
+                        continue  # 扫描过程中文件被删除
+        except FileNotFoundError:
+            pass
         except OSError as e:
             self.logger.warning(f"扫描目录失败: {directory} - {e}")
         
-        return sorted(found_files)
+        for files in classified.values():
+            files.sort()
+        return classified
     
     def _select_best_file(self, files: List[str]) -> Optional[str]:
         """选择最佳文件（优先选择第一个文件）"""
@@ -120,6 +176,21 @@ class CharacterManager:
     
     def validate_character(self, character_name: str) -> ValidationResult:
         """验证角色文件夹的完整性"""
+        _, result = self._scan_and_build(character_name)
+        return result
+    
+    def _scan_and_build(self, character_name: str,
+                        dir_entry: Optional[os.DirEntry] = None) -> Tuple[Optional[CharacterInfo], ValidationResult]:
+        """
+        扫描角色目录，一次完成验证和角色信息构建
+
+        Args:
+            character_name: 角色名称
+            dir_entry: 扫描角色根目录时得到的条目，提供时复用它的stat结果
+
+        Returns:
+            (角色信息, 验证结果)，验证失败时角色信息为None
+        """
         # 清理角色名称
         safe_name = sanitize_character_name(character_name)
         if safe_name != character_name:
@@ -127,41 +198,50 @@ class CharacterManager:
         
         result = ValidationResult(safe_name)
         
-        # 检查角色文件夹是否存在
+        # 检查角色文件夹是否存在，以及是否为目录
         character_dir = self._sanitize_path(os.path.join(self.characters_dir, safe_name))
-        if not os.path.exists(character_dir):
+        try:
+            if dir_entry is not None and dir_entry.name == safe_name:
+                dir_stat = dir_entry.stat()
+            else:
+                dir_stat = os.stat(character_dir)
+        except OSError:
             result.add_error("角色文件夹不存在")
-            return result
+            return None, result
         
-        # 检查是否为目录
-        if not os.path.isdir(character_dir):
+        # 修改时间取自扫描前的这次stat，扫描期间发生的变化会使负缓存失效
+        result.dir_mtime_ns = dir_stat.st_mtime_ns
+        if not stat.S_ISDIR(dir_stat.st_mode):
             result.add_error("角色路径不是目录")
-            return result
+            return None, result
+        
+        # 一次扫描角色目录，按类型分组
+        classified = self._classify_dir(character_dir)
         
         # 查找音频文件
-        audio_files = self._find_files_by_type(character_dir, self.supported_audio_formats)
+        audio_files = classified['audio']
         if not audio_files:
             result.add_error("缺少参考音频文件")
         else:
-            for audio_file in audio_files:
-                result.add_found_file('audio', audio_file)
-                file_size = get_file_size_mb(audio_file)
+            for audio_file, size_bytes in audio_files:
+                result.add_found_file('audio', audio_file, size_bytes)
+                file_size = bytes_to_mb(size_bytes)
                 if file_size > 50:  # 50MB
                     result.add_warning(f"音频文件较大: {file_size:.1f}MB")
         
         # 查找图片文件
-        image_files = self._find_files_by_type(character_dir, self.supported_image_formats)
-        for image_file in image_files:
-            result.add_found_file('images', image_file)
-            file_size = get_file_size_mb(image_file)
+        image_files = classified['images']
+        for image_file, size_bytes in image_files:
+            result.add_found_file('images', image_file, size_bytes)
+            file_size = bytes_to_mb(size_bytes)
             if file_size > 10:  # 10MB
                 result.add_warning(f"图片文件较大: {file_size:.1f}MB")
         
         # 查找视频文件
-        video_files = self._find_files_by_type(character_dir, self.supported_video_formats)
-        for video_file in video_files:
-            result.add_found_file('videos', video_file)
-            file_size = get_file_size_mb(video_file)
+        video_files = classified['videos']
+        for video_file, size_bytes in video_files:
+            result.add_found_file('videos', video_file, size_bytes)
+            file_size = bytes_to_mb(size_bytes)
             if file_size > 100:  # 100MB
                 result.add_warning(f"视频文件较大: {file_size:.1f}MB")
         
@@ -169,68 +249,28 @@ class CharacterManager:
         if not result.has_visual():
             result.add_error("缺少参考图像或视频文件")
         
-        # 检查配置文件
-        config_path = os.path.join(character_dir, "config.json")
-        if os.path.exists(config_path):
-            try:
-                from character_models import CharacterConfig
-                config = CharacterConfig.load_config(character_dir)
-                if config:
-                    result.add_warning("发现配置文件，将被使用")
-            except CharacterFileError as e:
-                result.add_warning(f"配置文件加载失败: {e}")
-        
-        return result
-    
-    def load_character(self, character_name: str) -> CharacterInfo:
-        """加载指定角色的信息"""
-        # 检查缓存
-        cached = self._get_cached_character(character_name)
-        if cached:
-            return cached
-        
-        # 清理角色名称
-        safe_name = sanitize_character_name(character_name)
-        
-        # 验证角色
-        validation_result = self.validate_character(safe_name)
-        if not validation_result.is_valid:
-            raise CharacterValidationError(safe_name, validation_result.errors)
+        # 检查配置文件（只加载一次，验证和构建角色信息共用）
+        config = {}
+        try:
+            config = CharacterConfig.load_config(character_dir)
+            if config:
+                result.add_warning("发现配置文件，将被使用")
+        except CharacterFileError as e:
+            result.add_warning(f"配置文件加载失败: {e}")
         
-        # 获取角色目录
-        character_dir = self._sanitize_path(os.path.join(self.characters_dir, safe_name))
+        if not result.is_valid:
+            return None, result
         
         # 选择最佳音频文件
-        audio_files = validation_result.found_files['audio']
-        if not audio_files:
-            raise CharacterValidationError(safe_name, ["缺少参考音频文件"])
-        audio_path = self._select_best_file(audio_files)
+        audio_path = self._select_best_file(result.found_files['audio'])
         
-        # 选择最佳视觉文件
-        visual_path = None
-        visual_type = None
-        
-        # 优先选择图片
-        image_files = validation_result.found_files['images']
-        if image_files:
-            visual_path = self._select_best_file(image_files)
+        # 选择最佳视觉文件：优先选择图片，其次选择视频
+        if result.has_images():
+            visual_path = self._select_best_file(result.found_files['images'])
             visual_type = 'image'
         else:
-            # 其次选择视频
-            video_files = validation_result.found_files['videos']
-            if video_files:
-                visual_path = self._select_best_file(video_files)
-                visual_type = 'video'
-        
-        if not visual_path:
-            raise CharacterValidationError(safe_name, ["缺少参考图像或视频文件"])
-        
-        # 加载配置
-        try:
-            from character_models import CharacterConfig
-            config = CharacterConfig.load_config(character_dir)
-        except CharacterFileError:
-            config = {}
+            visual_path = self._select_best_file(result.found_files['videos'])
+            visual_type = 'video'
         
         # 创建角色信息
         character_info = CharacterInfo(
@@ -240,47 +280,111 @@ class CharacterManager:
             visual_type=visual_type,
             config=config,
             character_dir=character_dir,
-            validation_result=validation_result
+            validation_result=result
         )
+        return character_info, result
+    
+    def load_character(self, character_name: str) -> CharacterInfo:
+        """加载指定角色的信息"""
+        return self._load_with_key(character_name, self._get_cache_key(character_name))
+    
+    def _load_with_key(self, character_name: str, cache_key: Tuple[str, int],
+                       dir_entry: Optional[os.DirEntry] = None) -> CharacterInfo:
+        """使用已计算好的缓存键加载角色（批量加载时共用一次根目录stat和扫描得到的目录条目）"""
+        # 检查缓存
+        entry = self._get_cached_entry(cache_key)
+        if entry is None:
+            with self._lock:
+                # 获得锁后再次检查，其他线程可能已经加载完成
+                entry = self._get_cached_entry(cache_key)
+                if entry is None:
+                    return self._load_from_disk(character_name, cache_key, dir_entry)
+        
+        if entry.character_info is None:
+            result = entry.validation_result
+            raise CharacterValidationError(result.character_name, result.errors)
+        return entry.character_info
+    
+    def _load_from_disk(self, character_name: str, cache_key: Tuple[str, int],
+                        dir_entry: Optional[os.DirEntry] = None) -> CharacterInfo:
+        """从磁盘验证并加载角色信息，结果（包括验证失败）写入缓存"""
+        character_info, validation_result = self._scan_and_build(character_name, dir_entry=dir_entry)
+        if character_info is None:
+            self._cache_failure(cache_key, validation_result)
+            raise CharacterValidationError(validation_result.character_name, validation_result.errors)
         
         # 缓存角色信息
-        self._cache_character(character_info)
+        self._cache_character(cache_key, character_info)
         
         return character_info
     
+    def _list_character_entries(self) -> Tuple[int, List[os.DirEntry]]:
+        """
+        单次扫描角色根目录
+
+        Returns:
+            (根目录修改时间, 非隐藏子目录的条目列表)，所有角色共用这一个缓存键时间戳
+        
+        Raises:
+            OSError: 根目录无法访问
+        """
+        root_mtime_ns = os.stat(self.characters_dir).st_mtime_ns
+        with os.scandir(self.characters_dir) as entries:
+            # 跳过隐藏目录；is_dir() 使用目录项自带的类型信息，不需要额外的stat
+            character_entries = [entry for entry in entries
+                                 if not entry.name.startswith('.') and entry.is_dir()]
+        return root_mtime_ns, character_entries
+    
+    def _load_entry(self, entry: os.DirEntry, root_mtime_ns: int) -> CharacterInfo:
+        """加载根目录扫描得到的角色条目"""
+        return self._load_with_key(entry.name, (entry.name, root_mtime_ns), entry)
+    
     def scan_characters(self) -> Dict[str, CharacterInfo]:
         """扫描characters目录，返回所有有效角色"""
-        if not os.path.exists(self.characters_dir):
+        try:
+            root_mtime_ns, entries = self._list_character_entries()
+        except FileNotFoundError:
             self.logger.warning(f"角色目录不存在: {self.characters_dir}")
             return {}
+        except OSError as e:
+            self.logger.error(f"扫描角色目录失败: {e}")
+            root_mtime_ns, entries = 0, []
         
         characters = {}
+        for entry in entries:
+            character_name = entry.name
+            try:
+                characters[character_name] = self._load_entry(entry, root_mtime_ns)
+                self.logger.info(f"加载角色: {character_name}")
+            except CharacterValidationError as e:
+                self.logger.warning(f"角色验证失败: {character_name} - {e.errors}")
+            except Exception as e:
+                self.logger.error(f"加载角色失败: {character_name} - {e}")
         
+        self.characters = characters
+        return characters
+    
+    def warmup_all(self) -> int:
+        """
+        预热缓存：单次扫描角色根目录，把所有角色（包括验证失败的结果）加载进缓存
+
+        Returns:
+            有效角色数量
+        """
         try:
-            with os.scandir(self.characters_dir) as entries:
-                for entry in entries:
-                    if entry.is_dir():
-                        character_name = entry.name
-                        try:
-                            # 跳过隐藏目录
-                            if character_name.startswith('.'):
-                                continue
-                            
-                            # 尝试加载角色
-                            character_info = self.load_character(character_name)
-                            characters[character_name] = character_info
-                            self.logger.info(f"加载角色: {character_name}")
-                            
-                        except CharacterValidationError as e:
-                            self.logger.warning(f"角色验证失败: {character_name} - {e.errors}")
-                        except Exception as e:
-                            self.logger.error(f"加载角色失败: {character_name} - {e}")
-        
+            root_mtime_ns, entries = self._list_character_entries()
         except OSError as e:
-            self.logger.error(f"扫描角色目录失败: {e}")
+            self.logger.warning(f"扫描角色目录失败: {e}")
+            return 0
         
-        self.characters = characters
-        return characters
+        loaded = 0
+        for entry in entries:
+            try:
+                self._load_entry(entry, root_mtime_ns)
+                loaded += 1
+            except CharacterError as e:
+                self.logger.debug(f"预热跳过角色: {entry.name} - {e}")
+        return loaded
     
     def list_characters(self) -> List[str]:
         """列出所有可用角色名称"""
@@ -296,9 +400,8 @@ class CharacterManager:
             return None
     
     def character_exists(self, character_name: str) -> bool:
-        """检查角色是否存在"""
-        result = self.validate_character(character_name)
-        return result.is_valid
+        """检查角色是否存在（与 load_character 共用缓存，包括负缓存）"""
+        return self.get_character_info(character_name) is not None
     
     def get_character_summary(self, character_name: str) -> Optional[str]:
         """获取角色摘要信息"""
@@ -310,25 +413,45 @@ class CharacterManager:
                 return validation_result.get_detailed_summary()
             else:
                 return f"角色 '{character_name}' 基本信息:\n" \
-                       f"  音频: {Path(character_info.audio_path).name}\n" \
-                       f"  视觉: {Path(character_info.visual_path).name} ({character_info.visual_type})"
+                       f"  音频: {os.path.basename(character_info.audio_path)}\n" \
+                       f"  视觉: {os.path.basename(character_info.visual_path)} ({character_info.visual_type})"
         
         except CharacterError as e:
             return f"无法获取角色信息: {e}"
     
+    def get_character_summary_dict(self, character_name: str) -> Optional[Dict[str, Any]]:
+        """获取结构化的角色摘要（便于程序和测试直接读取字段），角色不可用时返回None"""
+        character_info = self.get_character_info(character_name)
+        if character_info is None:
+            return None
+        
+        validation_result = character_info.validation_result
+        return {
+            'name': character_info.name,
+            'audio': character_info.audio_path,
+            'visual': character_info.visual_path,
+            'visual_type': character_info.visual_type,
+            'valid': validation_result.is_valid if validation_result else True,
+            'warnings': list(validation_result.warnings) if validation_result else [],
+        }
+    
     def clear_cache(self):
         """清除缓存"""
-        self.cache.clear()
+        with self._lock:
+            self.cache.clear()
         self.logger.info("角色缓存已清除")
     
     def get_cache_stats(self) -> Dict[str, int]:
         """获取缓存统计信息"""
-        total_entries = len(self.cache)
-        expired_entries = sum(1 for entry in self.cache.values() if entry.is_expired())
+        with self._lock:
+            total_entries = len(self.cache)
+            expired_entries = sum(1 for entry in self.cache.values() if entry.is_expired())
+            negative_entries = sum(1 for entry in self.cache.values() if entry.character_info is None)
         active_entries = total_entries - expired_entries
         
         return {
             'total_entries': total_entries,
             'active_entries': active_entries,
-            'expired_entries': expired_entries
+            'expired_entries': expired_entries,
+            'negative_entries': negative_entries
         }
\ No newline at end of file
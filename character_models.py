@@ -2,8 +2,10 @@
 数字人角色管理模块 - 数据模型和异常类
 """
 
+import copy
 import os
-from typing import Dict, List, Optional, Any, Union
+import re
+from typing import Dict, List, Optional, Any, Tuple, Union
 from dataclasses import dataclass, field
 from pathlib import Path
 import json
@@ -51,9 +53,9 @@ class CharacterInfo:
     validation_result: Optional['ValidationResult'] = None
     
     def __post_init__(self):
-        """初始化后处理"""
+        """初始化后处理（character_dir 只在这里计算一次，之后直接读取属性）"""
         if not self.character_dir and self.audio_path:
-            self.character_dir = str(Path(self.audio_path).parent)
+            self.character_dir = os.path.dirname(self.audio_path) or '.'
     
     def get_positive_prompt(self, default: str = "A person talking") -> str:
         """获取正面提示词"""
@@ -80,6 +82,8 @@ class ValidationResult:
         'images': [],
         'videos': []
     })
+    file_sizes: Dict[str, int] = field(default_factory=dict)  # 文件路径 -> 字节数（扫描时记录）
+    dir_mtime_ns: int = 0  # 扫描前角色目录的修改时间（目录不存在时为0）
     
     def add_error(self, message: str):
         """添加错误信息"""
@@ -90,10 +94,12 @@ class ValidationResult:
         """添加警告信息"""
         self.warnings.append(message)
     
-    def add_found_file(self, file_type: str, file_path: str):
-        """添加找到的文件"""
+    def add_found_file(self, file_type: str, file_path: str, size_bytes: Optional[int] = None):
+        """添加找到的文件，可同时记录扫描时得到的文件大小"""
         if file_type in self.found_files:
             self.found_files[file_type].append(file_path)
+            if size_bytes is not None:
+                self.file_sizes[file_path] = size_bytes
     
     def has_audio(self) -> bool:
         """是否有音频文件"""
@@ -137,7 +143,7 @@ class ValidationResult:
             if files:
                 lines.append(f"  {file_type}: {len(files)} 个")
                 for file in files[:3]:  # 只显示前3个文件
-                    lines.append(f"    - {Path(file).name}")
+                    lines.append(f"    - {os.path.basename(file)}")
                 if len(files) > 3:
                     lines.append(f"    ... 还有 {len(files) - 3} 个文件")
         
@@ -147,27 +153,41 @@ class ValidationResult:
 class CharacterConfig:
     """角色配置管理"""
     
+    # 已解析的配置缓存: 配置文件路径 -> ((st_mtime_ns, st_size), 配置字典)
+    _CONFIG_CACHE: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+    
     @staticmethod
     def load_config(character_dir: str) -> Dict[str, Any]:
-        """加载角色配置文件"""
+        """加载角色配置文件，文件未修改时直接返回缓存结果的副本"""
         config_path = os.path.join(character_dir, "config.json")
-        if not os.path.exists(config_path):
+        try:
+            stat = os.stat(config_path)
+        except OSError:
             return {}
         
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = CharacterConfig._CONFIG_CACHE.get(config_path)
+        if cached is not None and cached[0] == signature:
+            return copy.deepcopy(cached[1])
+        
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                config = json.load(f)
         except (json.JSONDecodeError, IOError) as e:
             raise CharacterFileError(
                 Path(character_dir).name, 
                 config_path, 
                 f"配置文件加载失败: {e}"
             )
+        
+        CharacterConfig._CONFIG_CACHE[config_path] = (signature, config)
+        return copy.deepcopy(config)
     
     @staticmethod
     def save_config(character_dir: str, config: Dict[str, Any]):
         """保存角色配置文件"""
         config_path = os.path.join(character_dir, "config.json")
+        CharacterConfig._CONFIG_CACHE.pop(config_path, None)
         try:
             with open(config_path, 'w', encoding='utf-8') as f:
                 json.dump(config, f, ensure_ascii=False, indent=2)
@@ -195,44 +215,63 @@ class CharacterConfig:
         }
 
 
+def bytes_to_mb(size_bytes: int) -> float:
+    """字节数转换为MB"""
+    return size_bytes / (1024 * 1024)
+
+
 def get_file_size_mb(file_path: str) -> float:
-    """获取文件大小（MB）"""
-    if not os.path.exists(file_path):
+    """获取文件大小（MB），文件不存在时返回0"""
+    try:
+        return bytes_to_mb(os.stat(file_path).st_size)
+    except OSError:
         return 0.0
-    return os.path.getsize(file_path) / (1024 * 1024)
+
+
+AUDIO_EXTENSIONS = frozenset({'.mp3', '.wav', '.m4a', '.flac', '.aac', '.ogg'})
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.gif'})
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.flv', '.webm'})
+
+
+def get_file_extension(file_path: str) -> str:
+    """
+    获取小写的文件扩展名（含点）
+
+    与 os.path.splitext 语义一致：只看最后一级文件名，隐藏文件（如 '.mp3'）视为没有扩展名。
+    只对扩展名部分做 lower()，不处理整个路径。
+    """
+    name_start = file_path.rfind(os.sep) + 1
+    if os.altsep:
+        name_start = max(name_start, file_path.rfind(os.altsep) + 1)
+    dot = file_path.rfind('.', name_start)
+    if dot == -1 or not file_path[name_start:dot].strip('.'):
+        return ''
+    return file_path[dot:].lower()
 
 
 def is_valid_audio_file(file_path: str) -> bool:
     """检查是否为有效的音频文件"""
-    audio_extensions = {'.mp3', '.wav', '.m4a', '.flac', '.aac', '.ogg'}
-    return os.path.splitext(file_path)[1].lower() in audio_extensions
+    return get_file_extension(file_path) in AUDIO_EXTENSIONS
 
 
 def is_valid_image_file(file_path: str) -> bool:
     """检查是否为有效的图片文件"""
-    image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.gif'}
-    return os.path.splitext(file_path)[1].lower() in image_extensions
+    return get_file_extension(file_path) in IMAGE_EXTENSIONS
 
 
 def is_valid_video_file(file_path: str) -> bool:
     """检查是否为有效的视频文件"""
-    video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.flv', '.webm'}
-    return os.path.splitext(file_path)[1].lower() in video_extensions
+    return get_file_extension(file_path) in VIDEO_EXTENSIONS
+
+
+# 路径分隔符和其他文件名中不安全的字符
+_UNSAFE_NAME_CHARS = re.compile(r'[/\\:*?"<>|\0]')
 
 
 def sanitize_character_name(name: str) -> str:
     """清理角色名称，移除不安全字符"""
-    # 移除路径分隔符和其他危险字符
-    unsafe_chars = {'/', '\\', ':', '*', '?', '"', '<', '>', '|', '\0'}
-    sanitized = name
-    for char in unsafe_chars:
-        sanitized = sanitized.replace(char, '_')
-    
-    # 移除开头和结尾的空格和点
-    sanitized = sanitized.strip(' .')
-    
-    # 确保不为空
-    if not sanitized:
-        sanitized = "unnamed_character"
+    # 一次替换所有路径分隔符和其他危险字符（每个字符替换为一个下划线）
+    sanitized = _UNSAFE_NAME_CHARS.sub('_', name)
     
-    return sanitized
\ No newline at end of file
+    # 移除开头和结尾的空格和点，确保不为空
+    return sanitized.strip(' .') or "unnamed_character"
@@ -3,6 +3,7 @@
 """
 
 import os
+import shutil
 import time
 import uuid
 import json
@@ -10,13 +11,16 @@ import websocket
 import urllib.request
 import urllib.parse
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Callable, Dict, List, Optional, Any, Tuple
 from pathlib import Path
 
 from character_manager_core import CharacterManager
 from character_models import CharacterInfo, CharacterError, CharacterNotFoundError
 
 
+DOWNLOAD_CHUNK_SIZE = 128 * 1024  # 下载时每次读写的字节数
+
+
 class DigitalHumanWorkflowClient:
     """数字人工作流客户端 - 直接实现"""
     
@@ -395,7 +399,9 @@ class DigitalHumanWorkflowClient:
     def download_file(self, file_info: Dict[str, Any], save_path: str) -> bool:
         """下载生成的文件"""
         try:
-            urllib.request.urlretrieve(file_info['url'], save_path)
+            # 以128KB为单位读写，urlretrieve默认每次只处理8KB
+            with urllib.request.urlopen(file_info['url']) as response, open(save_path, 'wb') as f:
+                shutil.copyfileobj(response, f, length=DOWNLOAD_CHUNK_SIZE)
             self.logger.info(f"文件下载成功: {save_path}")
             return True
         except Exception as e:
@@ -479,8 +485,13 @@ class DigitalHumanGenerator:
     
     def __init__(self, server_address: str = "127.0.0.1:6006", 
                  characters_dir: str = "characters",
-                 output_dir: str = "outputs"):
-        self.character_manager = CharacterManager(characters_dir)
+                 output_dir: str = "outputs",
+                 character_manager: Optional[CharacterManager] = None,
+                 sleep_fn: Callable[[float], None] = time.sleep):
+        # 可以传入已有的角色管理器，与调用方共用同一份角色缓存
+        self.character_manager = character_manager or CharacterManager(characters_dir)
+        # 轮询等待函数，测试中可以替换为不等待的函数
+        self.sleep_fn = sleep_fn
         self.workflow_client = DigitalHumanWorkflowClient(server_address)
         self.default_workflow = "./workflows/voice-video-final-api.json"
         self.output_dir = output_dir
@@ -803,7 +814,7 @@ class DigitalHumanGenerator:
                 except:
                     pass
             
-            time.sleep(1)
+            self.sleep_fn(1)
         
         elapsed = int(current_time - start_time)
         print(f"\n⏰ 监控超时 ({timeout}秒，实际用时: {elapsed}秒)")
@@ -957,20 +968,20 @@ class DigitalHumanGenerator:
         try:
             character_info = self.character_manager.load_character(character_name)
             
-            # 检查文件是否存在
-            if not os.path.exists(character_info.audio_path):
+            # 检查文件是否存在并获取文件大小（每个文件只stat一次）
+            from character_models import bytes_to_mb
+            try:
+                audio_size = bytes_to_mb(os.stat(character_info.audio_path).st_size)
+            except OSError:
                 print(f"❌ 音频文件不存在: {character_info.audio_path}")
                 return False
             
-            if not os.path.exists(character_info.visual_path):
+            try:
+                visual_size = bytes_to_mb(os.stat(character_info.visual_path).st_size)
+            except OSError:
                 print(f"❌ 视觉文件不存在: {character_info.visual_path}")
                 return False
             
-            # 检查文件大小
-            from character_models import get_file_size_mb
-            audio_size = get_file_size_mb(character_info.audio_path)
-            visual_size = get_file_size_mb(character_info.visual_path)
-            
             if audio_size > 100:
                 print(f"⚠️ 音频文件较大: {audio_size:.1f}MB")
             
@@ -5,14 +5,190 @@
 """
 
 import json
+import asyncio
+import logging
+import io
+import selectors
+import shutil
+import signal
+import socket
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import websocket
-import urllib.request
-import urllib.parse
 import uuid
 import os
+import random
 import time
+import sys
 import argparse
-from typing import Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field, fields
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+try:
+    import msgspec
+except ImportError:  # 未安装msgspec时使用标准库json解析进度消息
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库json处理HTTP请求/响应
+    orjson = None
+
+
+class _ConsoleHandler(logging.Handler):
+    """
+    输出到当前 sys.stdout 的日志处理器
+
+    与 StreamHandler 不同，不会在每条记录后 flush；
+    输出先留在 stdout 缓冲区中，由 flush_console() 在每个阶段结束时统一刷新。
+    """
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            sys.stdout.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            sys.stdout.flush()
+        finally:
+            self.release()
+
+
+logger = logging.getLogger('digital_human')
+if not logger.handlers:
+    _console_handler = _ConsoleHandler()
+    _console_handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_console_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def flush_console():
+    """刷新已缓冲的控制台输出（在阶段边界调用）"""
+    for handler in logger.handlers:
+        handler.flush()
+
+
+@dataclass
+class ProgressData:
+    """WebSocket进度消息的data字段"""
+    prompt_id: Optional[str] = None
+    node: Optional[str] = None
+    value: Union[int, float] = 0
+    max: Union[int, float] = 1
+    nodes: Optional[Dict[str, Dict[str, Any]]] = None
+    exception_message: Optional[str] = None
+
+
+@dataclass
+class ProgressMessage:
+    """WebSocket进度消息"""
+    type: str
+    data: ProgressData = field(default_factory=ProgressData)
+
+
+def _dumps(obj: Any) -> bytes:
+    """序列化为UTF-8编码的JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+_PROGRESS_DATA_FIELDS = tuple(f.name for f in fields(ProgressData))
+_progress_decoder = msgspec.json.Decoder(ProgressMessage) if msgspec else None
+
+
+def decode_progress_message(message: str) -> Optional[ProgressMessage]:
+    """解析WebSocket进度消息，格式不符时返回None"""
+    try:
+        if _progress_decoder is not None:
+            return _progress_decoder.decode(message)
+
+        raw = json.loads(message)
+        data = raw.get('data') or {}
+        return ProgressMessage(
+            type=raw['type'],
+            data=ProgressData(**{name: data[name] for name in _PROGRESS_DATA_FIELDS if name in data})
+        )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+@lru_cache(maxsize=8)
+def _read_workflow_bytes(workflow_path: str, mtime_ns: int) -> bytes:
+    """
+    读取工作流文件的原始字节，按 (路径, 修改时间) 缓存，文件被修改后自动重新读取
+
+    缓存的是字节串而不是解析结果：调用方每次用 _loads 解析得到独立的字典，
+    可以放心修改，解析比深拷贝同样大小的字典更快。
+    """
+    with open(workflow_path, 'rb') as f:
+        return f.read()
+
+
+class _MultipartFileStream:
+    """
+    流式 multipart/form-data 请求体
+
+    requests 的 files= 参数会先把整个文件读入内存再发送，上传几百MB的视频时内存占用很高。
+    这里只预先生成表单头尾，文件内容在发送时按块读取，内存占用与文件大小无关。
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: str, file_path: str,
+                 mime_type: str = 'application/octet-stream'):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        filename = os.path.basename(file_path)
+        for char, escaped in (('"', '%22'), ('\r', '%0D'), ('\n', '%0A')):
+            filename = filename.replace(char, escaped)
+
+        head = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                for name, value in fields.items()]
+        head.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                    f'filename="{filename}"\r\nContent-Type: {mime_type}\r\n\r\n')
+        head_bytes = ''.join(head).encode('utf-8')
+        tail_bytes = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+        self._file = open(file_path, 'rb')
+        file_size = os.fstat(self._file.fileno()).st_size
+        self._length = len(head_bytes) + file_size + len(tail_bytes)
+        self._segments = [io.BytesIO(head_bytes), self._file, io.BytesIO(tail_bytes)]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        """按顺序读取表单头、文件内容和表单尾"""
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._segments:
+            chunk = self._segments[0].read(size)
+            if not chunk:
+                self._segments.pop(0)
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 class DigitalHumanWorkflowClient:
@@ -20,16 +196,58 @@ class DigitalHumanWorkflowClient:
         self.server_address = server_address
         self.client_id = str(uuid.uuid4())
         self.ws = None
+        # 预先拼接好服务器地址，避免每次请求重复构造
+        self._base_http = f"http://{server_address}"
+        self._base_ws = f"ws://{server_address}"
+        self._view_tpl = self._base_http + "/view?filename={fn}&type={t}"
+        # 整个客户端生命周期复用同一个HTTP会话，连接池化，避免每次请求重新握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                              max_retries=Retry(total=3, backoff_factor=0.3))
+        self._session.mount("http://", adapter)
+        # 进度输出节流：终端下最多30Hz刷新，非终端（容器日志等）每秒最多一行
+        self._tty = sys.stdout.isatty()
+        self._last_emit = 0.0
+
+    def _emit_progress(self, text: str):
+        """输出进度信息（已节流）"""
+        now = time.monotonic()
+        if self._tty:
+            if now - self._last_emit > 0.033:
+                print(f"\r{text}", end='', flush=True)
+                self._last_emit = now
+        elif now - self._last_emit >= 1.0:
+            print(text, flush=True)
+            self._last_emit = now
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """关闭WebSocket连接和HTTP会话"""
+        self.disconnect()
+        self._session.close()
+
+    def _get_json(self, path: str) -> Any:
+        """GET请求服务器接口并解析JSON响应"""
+        response = self._session.get(self._base_http + path, timeout=30)
+        response.raise_for_status()
+        return _loads(response.content)
 
     def connect(self):
         """建立WebSocket连接"""
         try:
-            self.ws = websocket.WebSocket()
-            self.ws.connect(f"ws://{self.server_address}/ws?clientId={self.client_id}")
-            print(f"已连接到服务器: {self.server_address}")
+            # 进度消息随后会做UTF-8解码和JSON解析，跳过库内的逐帧UTF-8校验；
+            # 连接只在单线程中使用，不需要收发锁
+            self.ws = websocket.WebSocket(skip_utf8_validation=True, enable_multithread=False)
+            self.ws.connect(f"{self._base_ws}/ws?clientId={self.client_id}")
+            logger.info(f"已连接到服务器: {self.server_address}")
             return True
         except Exception as e:
-            print(f"连接失败: {e}")
+            logger.info(f"连接失败: {e}")
             return False
 
     def disconnect(self):
@@ -50,78 +268,94 @@ class DigitalHumanWorkflowClient:
             上传后的文件名，失败返回None
         """
         if not os.path.exists(file_path):
-            print(f"文件不存在: {file_path}")
+            logger.info(f"文件不存在: {file_path}")
             return None
 
         try:
-            import requests
-
-            print(f"正在上传文件: {file_path}")
-            print(f"文件大小: {os.path.getsize(file_path)} bytes")
-            print(f"服务器地址: {self.server_address}")
-
-            with open(file_path, 'rb') as f:
-                files = {'image': (os.path.basename(file_path), f, 'application/octet-stream')}
-                data = {
-                    'type': file_type,
-                    'subfolder': ''
-                }
-
-                upload_url = f"http://{self.server_address}/upload/image"
-                print(f"上传URL: {upload_url}")
+            logger.info(f"正在上传文件: {file_path}")
+            logger.info(f"文件大小: {os.path.getsize(file_path)} bytes")
+            logger.info(f"服务器地址: {self.server_address}")
+            flush_console()  # 大文件上传耗时较长，先输出已有信息
+
+            fields = {
+                'type': file_type,
+                'subfolder': ''
+            }
+            with _MultipartFileStream(fields, 'image', file_path) as body:
+                upload_url = self._base_http + "/upload/image"
+                logger.info(f"上传URL: {upload_url}")
 
-                response = requests.post(
+                response = self._session.post(
                     upload_url,
-                    files=files,
-                    data=data,
+                    data=body,
+                    headers={'Content-Type': body.content_type},
                     timeout=30
                 )
 
-                print(f"HTTP状态码: {response.status_code}")
-                print(f"响应内容: {response.text}")
+                logger.info(f"HTTP状态码: {response.status_code}")
+                logger.info(f"响应内容: {response.text}")
 
                 if response.status_code == 200:
                     try:
                         result = response.json()
-                        print(f"JSON响应: {result}")
+                        logger.info(f"JSON响应: {result}")
 
                         # ComfyUI上传成功时会返回文件名、subfolder和type字段
                         if 'name' in result:
                             uploaded_name = result.get('name', os.path.basename(file_path))
-                            print(f"文件上传成功: {file_path} -> {uploaded_name}")
+                            logger.info(f"文件上传成功: {file_path} -> {uploaded_name}")
                             return uploaded_name
                         else:
                             error_msg = result.get('error', '未知错误')
-                            print(f"文件上传失败: {error_msg}")
+                            logger.info(f"文件上传失败: {error_msg}")
                             return None
                     except ValueError as e:
-                        print(f"解析JSON响应失败: {e}")
-                        print(f"原始响应: {response.text}")
+                        logger.info(f"解析JSON响应失败: {e}")
+                        logger.info(f"原始响应: {response.text}")
                         return None
                 else:
-                    print(f"HTTP请求失败: {response.status_code}")
-                    print(f"响应内容: {response.text}")
+                    logger.info(f"HTTP请求失败: {response.status_code}")
+                    logger.info(f"响应内容: {response.text}")
                     return None
 
-        except ImportError:
-            print("需要安装requests库: pip install requests")
-            return None
         except requests.exceptions.RequestException as e:
-            print(f"网络请求异常: {e}")
+            logger.info(f"网络请求异常: {e}")
             return None
         except Exception as e:
-            print(f"文件上传异常: {e}")
+            logger.info(f"文件上传异常: {e}")
             return None
 
+    def _upload_many(self, file_paths: List[Optional[str]]) -> List[Optional[str]]:
+        """
+        并发上传多个文件
+
+        ComfyUI的上传接口每次只接收一个文件，这里在同一个HTTP会话上并发发起请求，
+        总耗时取决于最慢的上传而不是耗时之和。
+
+        Args:
+            file_paths: 本地文件路径列表，为空或不存在的路径原样返回（不上传）
+
+        Returns:
+            与输入顺序一致的结果列表，上传成功为服务器端文件名，失败为None
+        """
+        results: List[Optional[str]] = list(file_paths)
+        pending = [i for i, path in enumerate(file_paths) if path and os.path.exists(path)]
+        if not pending:
+            return results
+
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            for i, uploaded_name in zip(pending, executor.map(self.upload_file, [file_paths[i] for i in pending])):
+                results[i] = uploaded_name
+        return results
+
     def load_workflow(self, workflow_path: str) -> Optional[Dict[str, Any]]:
-        """加载工作流配置文件"""
+        """加载工作流配置文件，每次返回新解析的字典，调用方可以放心修改"""
         try:
-            with open(workflow_path, 'r', encoding='utf-8') as f:
-                workflow = json.load(f)
-            print(f"工作流配置加载成功: {workflow_path}")
+            workflow = _loads(_read_workflow_bytes(workflow_path, os.stat(workflow_path).st_mtime_ns))
+            logger.info(f"工作流配置加载成功: {workflow_path}")
             return workflow
         except Exception as e:
-            print(f"工作流配置加载失败: {e}")
+            logger.info(f"工作流配置加载失败: {e}")
             return None
 
     def update_workflow_parameters(self, workflow: Dict[str, Any],
@@ -173,39 +407,63 @@ class DigitalHumanWorkflowClient:
 
         return updated_workflow
 
-    def submit_workflow(self, workflow: Dict[str, Any]) -> Optional[str]:
-        """提交工作流到服务器"""
-        try:
-            prompt_id = str(uuid.uuid4())
+    def _build_submission(self, workflow: Dict[str, Any]) -> Tuple[str, bytes]:
+        """序列化提交数据，返回 (prompt_id, 请求体)"""
+        prompt_id = str(uuid.uuid4())
+        payload = {
+            "prompt": workflow,
+            "client_id": self.client_id,
+            "prompt_id": prompt_id
+        }
+        return prompt_id, _dumps(payload)
+
+    def _post_submission(self, body: bytes) -> Dict[str, Any]:
+        """发送已序列化的提交数据"""
+        response = self._session.post(
+            self._base_http + "/prompt",
+            data=body,
+            headers={'Content-Type': 'application/json', 'Content-Length': str(len(body))},
+            timeout=30
+        )
+        response.raise_for_status()
+        return _loads(response.content)
 
-            # 准备提交数据
-            payload = {
-                "prompt": workflow,
-                "client_id": self.client_id,
-                "prompt_id": prompt_id
-            }
+    def submit_workflow(self, workflow: Dict[str, Any], max_retries: int = 3) -> Optional[str]:
+        """
+        提交工作流到服务器
 
-            data = json.dumps(payload).encode('utf-8')
-            req = urllib.request.Request(f"http://{self.server_address}/prompt", data=data)
-            req.add_header('Content-Type', 'application/json')
-
-            # 发送请求
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                # 检查是否有node_errors，没有错误且有prompt_id就表示成功
-                if 'prompt_id' in result and not result.get('node_errors', {}):
-                    actual_prompt_id = result['prompt_id']
-                    print(f"工作流提交成功，Prompt ID: {actual_prompt_id}")
-                    return actual_prompt_id
-                else:
-                    print(f"工作流提交失败: {result}")
-                    return None
+        请求体只序列化一次，服务器返回5xx时重试会复用同一份数据
+        （同一个prompt_id），避免重复序列化大型工作流。连接错误由HTTP会话自动重试。
+        """
+        try:
+            _, body = self._build_submission(workflow)
+
+            for attempt in range(1, max_retries + 1):
+                try:
+                    result = self._post_submission(body)
+                    break
+                except requests.exceptions.HTTPError as e:
+                    status_code = e.response.status_code
+                    if status_code < 500 or attempt == max_retries:
+                        raise
+                    logger.info(f"服务器错误 {status_code}，重试提交 ({attempt}/{max_retries})...")
+                time.sleep(0.5 * attempt)
+
+            # 检查是否有node_errors，没有错误且有prompt_id就表示成功
+            if 'prompt_id' in result and not result.get('node_errors', {}):
+                actual_prompt_id = result['prompt_id']
+                logger.info(f"工作流提交成功，Prompt ID: {actual_prompt_id}")
+                return actual_prompt_id
+            else:
+                logger.info(f"工作流提交失败: {result}")
+                return None
 
         except Exception as e:
-            print(f"工作流提交异常: {e}")
+            logger.info(f"工作流提交异常: {e}")
             return None
 
-    def wait_for_completion(self, prompt_id: str, timeout: int = 600, show_progress: bool = True) -> bool:
+    def wait_for_completion(self, prompt_id: str, timeout: int = 600, show_progress: bool = True,
+                            check_on_status: bool = False) -> bool:
         """
         等待工作流执行完成
 
@@ -213,58 +471,85 @@ class DigitalHumanWorkflowClient:
             prompt_id: 工作流ID
             timeout: 超时时间（秒）
             show_progress: 是否显示详细进度信息
+            check_on_status: 收到队列status广播时检查任务状态。
+                监控其他客户端提交的任务时需要开启，因为执行进度消息只会发给提交者
 
         Returns:
             是否成功完成
         """
         if not self.ws:
-            print("WebSocket未连接")
+            logger.info("WebSocket未连接")
             return False
 
+        flush_console()
         start_time = time.time()
+        deadline = start_time + timeout
+        next_status_check = start_time + 30  # 每30秒检查一次任务是否还存在
         node_status = {}  # 跟踪节点状态
         last_progress_time = time.time()
 
+        # 用selector等待socket可读，避免每秒一次的recv超时异常
+        # 记录注册时的socket：连接断开时 websocket-client 会把 self.ws.sock 置为None，
+        # 注销时必须使用当初注册的对象
+        selector = selectors.DefaultSelector()
+        registered_sock = self.ws.sock
+        selector.register(registered_sock, selectors.EVENT_READ)
+
         try:
-            while time.time() - start_time < timeout:
-                # 设置超时以避免阻塞
-                self.ws.settimeout(1)
+            while True:
+                now = time.time()
+                if now >= deadline:
+                    break
+
+                # TLS连接可能已有解密后的缓冲数据，此时无需等待
+                pending = getattr(self.ws.sock, 'pending', None)
+                if not (pending and pending()):
+                    events = selector.select(timeout=min(deadline, next_status_check) - now)
+                    if not events:
+                        if time.time() >= next_status_check:
+                            next_status_check += 30
+                            task_status = self.check_task_status(prompt_id)
+                            if task_status == 'completed':
+                                logger.info("\n✅ 任务已在后台完成")
+                                return True
+                            elif task_status == 'not_found':
+                                logger.info("\n❌ 任务已不存在，可能已被清理")
+                                return False
+                        continue
+
                 try:
                     message = self.ws.recv()
                     if isinstance(message, str):
-                        data = json.loads(message)
-
-                        if data.get('type') == 'executing':
-                            exec_data = data.get('data', {})
-                            current_node = exec_data.get('node')
-                            current_prompt_id = exec_data.get('prompt_id')
+                        msg = decode_progress_message(message)
+                        if msg is None:
+                            continue
+                        msg_data = msg.data
 
-                            if current_prompt_id == prompt_id:
-                                if current_node is None:
-                                    print("\n✅ 工作流执行完成")
+                        if msg.type == 'executing':
+                            if msg_data.prompt_id == prompt_id:
+                                if msg_data.node is None:
+                                    logger.info("\n✅ 工作流执行完成")
                                     return True
                                 else:
                                     if show_progress:
                                         # 更新节点状态
-                                        node_status[current_node] = 'executing'
+                                        node_status[msg_data.node] = 'executing'
                                         progress_text = self.format_progress_display(node_status)
-                                        print(f"\r🔄 执行中: {progress_text}", end='', flush=True)
+                                        self._emit_progress(f"🔄 执行中: {progress_text}")
 
-                        elif data.get('type') == 'progress':
-                            progress = data.get('data', {})
-                            value = progress.get('value', 0)
-                            max_value = progress.get('max', 1)
+                        elif msg.type == 'progress':
+                            value = msg_data.value
+                            max_value = msg_data.max
                             if max_value > 0:
                                 percentage = (value / max_value) * 100
                                 if show_progress and time.time() - last_progress_time > 0.5:  # 限制更新频率
-                                    print(f"\r📊 进度: {percentage:.1f}% ({value}/{max_value})", end='', flush=True)
+                                    self._emit_progress(f"📊 进度: {percentage:.1f}% ({value}/{max_value})")
                                     last_progress_time = time.time()
 
-                        elif data.get('type') == 'progress_state':
+                        elif msg.type == 'progress_state':
                             # 详细的进度状态信息
-                            progress_data = data.get('data', {})
-                            if progress_data.get('prompt_id') == prompt_id:
-                                nodes = progress_data.get('nodes', {})
+                            if msg_data.prompt_id == prompt_id:
+                                nodes = msg_data.nodes or {}
                                 if show_progress:
                                     # 更新所有节点状态
                                     for node_id, node_info in nodes.items():
@@ -274,40 +559,42 @@ class DigitalHumanWorkflowClient:
                                     # 计算总体进度
                                     overall_progress = self.calculate_overall_progress(nodes)
                                     progress_text = self.format_progress_display(node_status)
-                                    print(f"\r📈 总进度: {overall_progress:.1%} | {progress_text}", end='', flush=True)
+                                    self._emit_progress(f"📈 总进度: {overall_progress:.1%} | {progress_text}")
 
-                        elif data.get('type') == 'error':
-                            error_data = data.get('data', {})
-                            print(f"\n❌ 执行错误: {error_data.get('exception_message', '未知错误')}")
+                        elif msg.type == 'error':
+                            logger.info(f"\n❌ 执行错误: {msg_data.exception_message or '未知错误'}")
                             return False
 
-                except websocket.WebSocketTimeoutException:
-                    # 每30秒检查一次任务是否还存在
-                    if int(time.time() - start_time) % 30 == 0:
-                        task_status = self.check_task_status(prompt_id)
-                        if task_status == 'completed':
-                            print("\n✅ 任务已在后台完成")
-                            return True
-                        elif task_status == 'not_found':
-                            print("\n❌ 任务已不存在，可能已被清理")
-                            return False
-                    continue
+                        elif msg.type == 'status' and check_on_status:
+                            task_status = self.check_task_status(prompt_id)
+                            if task_status == 'completed':
+                                logger.info("\n✅ 任务已完成")
+                                return True
+                            elif task_status == 'not_found':
+                                logger.info("\n❌ 任务已不存在，可能已被清理")
+                                return False
+
                 except Exception as e:
-                    print(f"\n⚠️ 接收消息异常: {e}")
+                    logger.info(f"\n⚠️ 接收消息异常: {e}")
                     # 检查是否是连接问题，如果是，尝试重新连接
                     if "connection" in str(e).lower() or "socket" in str(e).lower():
-                        print("🔄 尝试重新连接...")
+                        logger.info("🔄 尝试重新连接...")
+                        selector.unregister(registered_sock)
                         self.disconnect()
                         if self.connect():
+                            registered_sock = self.ws.sock
+                            selector.register(registered_sock, selectors.EVENT_READ)
                             continue
                     break
 
-            print(f"\n⏰ 等待超时 ({timeout}秒)")
+            logger.info(f"\n⏰ 等待超时 ({timeout}秒)")
             return False
 
         except Exception as e:
-            print(f"\n❌ 等待执行异常: {e}")
+            logger.info(f"\n❌ 等待执行异常: {e}")
             return False
+        finally:
+            selector.close()
 
     def calculate_overall_progress(self, nodes: Dict[str, Any]) -> float:
         """
@@ -377,31 +664,27 @@ class DigitalHumanWorkflowClient:
         """
         try:
             # 检查历史记录
-            url = f"http://{self.server_address}/history/{prompt_id}"
-            with urllib.request.urlopen(url) as response:
-                history = json.loads(response.read().decode('utf-8'))
-                if prompt_id in history:
-                    return 'completed'
+            history = self._get_json(f"/history/{prompt_id}")
+            if prompt_id in history:
+                return 'completed'
             
             # 检查队列
-            queue_url = f"http://{self.server_address}/queue"
-            with urllib.request.urlopen(queue_url) as response:
-                queue_data = json.loads(response.read().decode('utf-8'))
-                
-                # 检查正在执行的任务
-                # 队列项结构：[sequence_number, prompt_id, workflow, extra_data]
-                for item in queue_data.get('queue_running', []):
-                    if len(item) > 1 and item[1] == prompt_id:
-                        return 'running'
-                
-                # 检查等待队列
-                for item in queue_data.get('queue_pending', []):
-                    if len(item) > 1 and item[1] == prompt_id:
-                        return 'running'
+            queue_data = self._get_json("/queue")
+            
+            # 检查正在执行的任务
+            # 队列项结构：[sequence_number, prompt_id, workflow, extra_data]
+            for item in queue_data.get('queue_running', []):
+                if len(item) > 1 and item[1] == prompt_id:
+                    return 'running'
+            
+            # 检查等待队列
+            for item in queue_data.get('queue_pending', []):
+                if len(item) > 1 and item[1] == prompt_id:
+                    return 'running'
             
             return 'not_found'
         except Exception as e:
-            print(f"检查任务状态失败: {e}")
+            logger.info(f"检查任务状态失败: {e}")
             return None
 
     def poll_for_completion(self, prompt_id: str, timeout: int = 600) -> bool:
@@ -416,35 +699,40 @@ class DigitalHumanWorkflowClient:
             是否成功完成
         """
         start_time = time.time()
-        last_check_time = 0
-        check_interval = 5  # 每5秒检查一次
+        # 指数退避：短任务能很快发现完成，长任务的请求数也不会线性增长
+        delay = 0.2
+        max_delay = 5.0
+        last_status = None
         
-        print("=" * 60)
+        logger.info("=" * 60)
+        flush_console()
         
         while time.time() - start_time < timeout:
-            current_time = time.time()
+            status = self.check_task_status(prompt_id)
+            elapsed = int(time.time() - start_time)
             
-            # 每隔一段时间检查一次状态
-            if current_time - last_check_time >= check_interval:
-                status = self.check_task_status(prompt_id)
-                elapsed = int(current_time - start_time)
-                
-                if status == 'completed':
-                    print(f"\n✅ 任务已完成！ (用时: {elapsed}秒)")
-                    return True
-                elif status == 'running':
-                    print(f"\r🔄 任务运行中... (已用时: {elapsed}秒)", end='', flush=True)
-                elif status == 'not_found':
-                    print(f"\n❌ 任务不存在或已被清理！")
-                    return False
-                elif status is None:
-                    print(f"\n⚠️ 检查状态时出错")
-                
-                last_check_time = current_time
+            if status == 'completed':
+                logger.info(f"\n✅ 任务已完成！ (用时: {elapsed}秒)")
+                return True
+            elif status == 'running':
+                self._emit_progress(f"🔄 任务运行中... (已用时: {elapsed}秒)")
+            elif status == 'not_found':
+                logger.info(f"\n❌ 任务不存在或已被清理！")
+                return False
+            elif status is None:
+                logger.info(f"\n⚠️ 检查状态时出错")
+            
+            # 状态变化时重置等待间隔，否则逐步增大
+            if status != last_status:
+                delay = 0.2
+                last_status = status
+            else:
+                delay = min(delay * 1.5, max_delay)
             
-            time.sleep(1)
+            remaining = timeout - (time.time() - start_time)
+            time.sleep(max(0.0, min(delay + random.uniform(0, delay * 0.1), remaining)))
         
-        print(f"\n⏰ 监控超时 ({timeout}秒)")
+        logger.info(f"\n⏰ 监控超时 ({timeout}秒)")
         return False
 
     def monitor_progress_only(self, prompt_id: str, timeout: int = 600, auto_download: bool = True, output_dir: str = "outputs") -> bool:
@@ -461,72 +749,76 @@ class DigitalHumanWorkflowClient:
             是否成功完成
         """
         # 首先检查任务状态
-        print(f"🔍 检查任务状态 - Prompt ID: {prompt_id}")
+        logger.info(f"🔍 检查任务状态 - Prompt ID: {prompt_id}")
         task_status = self.check_task_status(prompt_id)
 
         if task_status == 'completed':
-            print("✅ 任务已完成！")
+            logger.info("✅ 任务已完成！")
             if auto_download:
-                print("📥 开始下载输出文件...")
+                logger.info("📥 开始下载输出文件...")
                 return self.get_result_by_prompt_id(prompt_id, output_dir)
             return True
         elif task_status == 'not_found':
-            print("❌ 任务不存在或已过期！")
+            logger.info("❌ 任务不存在或已过期！")
             return False
         elif task_status == 'running':
-            print("🔄 任务正在运行，使用轮询方式监控进度...")
+            logger.info("🔄 任务正在运行，通过WebSocket监控进度...")
         else:
-            print("⚠️ 无法确定任务状态，使用轮询方式监控...")
+            logger.info("⚠️ 无法确定任务状态，通过WebSocket监控...")
 
-        # 使用轮询方式监控，不依赖WebSocket
+        success = False
         try:
-            success = self.poll_for_completion(prompt_id, timeout)
+            # 优先使用WebSocket推送：队列变化时服务器会广播status消息，
+            # 收到后再检查一次任务状态，无需定时轮询history
+            if self.connect():
+                success = self.wait_for_completion(prompt_id, timeout, show_progress=True,
+                                                   check_on_status=True)
+                # 下载时会重新建立连接
+                self.disconnect()
+            else:
+                logger.info("⚠️ WebSocket连接失败，改用轮询方式监控...")
+                success = self.poll_for_completion(prompt_id, timeout)
 
             if success:
-                print(f"\n✅ 任务完成！")
+                logger.info(f"\n✅ 任务完成！")
                 if auto_download:
-                    print("📥 开始下载输出文件...")
-                    # 保持连接状态继续下载
+                    logger.info("📥 开始下载输出文件...")
                     download_success = self.get_result_by_prompt_id(prompt_id, output_dir)
                     if download_success:
-                        print(f"\n🎉 监控和下载全部完成！")
+                        logger.info(f"\n🎉 监控和下载全部完成！")
                         return True
                     else:
-                        print(f"\n⚠️ 任务完成但下载失败")
+                        logger.info(f"\n⚠️ 任务完成但下载失败")
                         return False
                 return True
             else:
-                print(f"\n❌ 任务失败或超时！")
+                logger.info(f"\n❌ 任务失败或超时！")
                 return False
 
         except Exception as e:
-            print(f"\n❌ 监控异常: {e}")
-            success = False
+            logger.info(f"\n❌ 监控异常: {e}")
             return False
         finally:
             try:
-                if not auto_download or not success:
-                    self.disconnect()
+                self.disconnect()
             except:
                 pass
 
     def get_results(self, prompt_id: str) -> Optional[Dict[str, Any]]:
         """获取工作流执行结果"""
         try:
-            url = f"http://{self.server_address}/history/{prompt_id}"
-            with urllib.request.urlopen(url) as response:
-                history = json.loads(response.read().decode('utf-8'))
-
-                if prompt_id in history:
-                    result = history[prompt_id]
-                    print("获取执行结果成功")
-                    return result
-                else:
-                    print("未找到执行结果")
-                    return None
+            history = self._get_json(f"/history/{prompt_id}")
+
+            if prompt_id in history:
+                result = history[prompt_id]
+                logger.info("获取执行结果成功")
+                return result
+            else:
+                logger.info("未找到执行结果")
+                return None
 
         except Exception as e:
-            print(f"获取结果异常: {e}")
+            logger.info(f"获取结果异常: {e}")
             return None
 
     def extract_output_files(self, result: Dict[str, Any]) -> Dict[str, list]:
@@ -540,7 +832,7 @@ class DigitalHumanWorkflowClient:
                 # 检查视频文件
                 if 'videos' in node_output:
                     for video in node_output['videos']:
-                        video_url = f"http://{self.server_address}/view?filename={video['filename']}&type={video['type']}"
+                        video_url = self._view_tpl.format(fn=video['filename'], t=video['type'])
                         files.append({
                             'type': 'video',
                             'filename': video['filename'],
@@ -551,7 +843,7 @@ class DigitalHumanWorkflowClient:
                 # 检查音频文件
                 if 'audios' in node_output:
                     for audio in node_output['audios']:
-                        audio_url = f"http://{self.server_address}/view?filename={audio['filename']}&type={audio['type']}"
+                        audio_url = self._view_tpl.format(fn=audio['filename'], t=audio['type'])
                         files.append({
                             'type': 'audio',
                             'filename': audio['filename'],
@@ -562,7 +854,7 @@ class DigitalHumanWorkflowClient:
                 # 检查图像文件
                 if 'images' in node_output:
                     for image in node_output['images']:
-                        image_url = f"http://{self.server_address}/view?filename={image['filename']}&type={image['type']}"
+                        image_url = self._view_tpl.format(fn=image['filename'], t=image['type'])
                         files.append({
                             'type': 'image',
                             'filename': image['filename'],
@@ -573,7 +865,7 @@ class DigitalHumanWorkflowClient:
                 # 检查GIF文件
                 if 'gifs' in node_output:
                     for gif in node_output['gifs']:
-                        gif_url = f"http://{self.server_address}/view?filename={gif['filename']}&type={gif['type']}"
+                        gif_url = self._view_tpl.format(fn=gif['filename'], t=gif['type'])
                         files.append({
                             'type': 'gif',
                             'filename': gif['filename'],
@@ -589,16 +881,55 @@ class DigitalHumanWorkflowClient:
     def download_file(self, file_info: Dict[str, Any], save_path: str) -> bool:
         """下载生成的文件"""
         try:
-            urllib.request.urlretrieve(file_info['url'], save_path)
-            print(f"文件下载成功: {save_path}")
+            # 流式写入，每次1MB，减少用户态拷贝和write调用次数
+            with self._session.get(file_info['url'], stream=True, timeout=30) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                with open(save_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=1 << 20)
+            logger.info(f"文件下载成功: {save_path}")
             return True
         except Exception as e:
-            print(f"文件下载失败: {e}")
+            logger.info(f"文件下载失败: {e}")
             return False
 
+    def _download_all(self, downloads: List[Tuple[Dict[str, Any], str]],
+                      concurrency: int = 8) -> List[bool]:
+        """
+        并发下载多个文件
+
+        Args:
+            downloads: (文件信息, 保存路径) 列表
+            concurrency: 最大并发数
+
+        Returns:
+            与 downloads 顺序一致的下载结果列表
+        """
+        # 保存路径相同的文件（如同名的 temp 和 output 文件）放在同一个任务里按原顺序下载，
+        # 避免两个线程同时写同一个文件；与串行下载一样，后下载的文件覆盖先下载的
+        groups: Dict[str, List[int]] = {}
+        for i, (_, save_path) in enumerate(downloads):
+            groups.setdefault(save_path, []).append(i)
+
+        results = [False] * len(downloads)
+
+        def download_group(indices: List[int]):
+            for i in indices:
+                results[i] = self.download_file(*downloads[i])
+
+        if len(groups) <= 1:
+            for indices in groups.values():
+                download_group(indices)
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(groups))) as executor:
+            list(executor.map(download_group, groups.values()))
+        return results
+
     def run_workflow(self, workflow_path: str, audio_path: str, video_path: str,
                     text_prompt: str, positive_prompt: str, negative_prompt: str = "",
-                    output_dir: str = "outputs") -> Optional[str]:
+                    output_dir: str = "outputs",
+                    workflow: Optional[Dict[str, Any]] = None) -> Optional[str]:
         """
         运行完整的数字人生成工作流
 
@@ -610,6 +941,7 @@ class DigitalHumanWorkflowClient:
             positive_prompt: 正面提示词
             negative_prompt: 负面提示词
             output_dir: 输出目录
+            workflow: 已加载的工作流配置（提供时跳过文件加载，会被原地修改）
 
         Returns:
             成功时返回prompt_id，失败返回None
@@ -623,23 +955,16 @@ class DigitalHumanWorkflowClient:
 
         try:
             # 加载工作流配置
-            workflow = self.load_workflow(workflow_path)
+            if workflow is None:
+                workflow = self.load_workflow(workflow_path)
             if not workflow:
                 return None
 
-            # 上传音频文件
-            if audio_path and os.path.exists(audio_path):
-                uploaded_audio = self.upload_file(audio_path)
-                if not uploaded_audio:
-                    return None
-                audio_path = uploaded_audio
-
-            # 上传视频参考图像
-            if video_path and os.path.exists(video_path):
-                uploaded_video = self.upload_file(video_path)
-                if not uploaded_video:
-                    return None
-                video_path = uploaded_video
+            # 并发上传音频文件和视频参考图像
+            uploaded = self._upload_many([audio_path, video_path])
+            if any(path and name is None for path, name in zip((audio_path, video_path), uploaded)):
+                return None
+            audio_path, video_path = uploaded
 
             # 更新工作流参数
             updated_workflow = self.update_workflow_parameters(
@@ -663,23 +988,22 @@ class DigitalHumanWorkflowClient:
             # 提取并下载输出文件
             output_files = self.extract_output_files(result)
             if output_files:
-                print(f"生成文件数量: {sum(len(files) for files in output_files.values())}")
+                logger.info(f"生成文件数量: {sum(len(files) for files in output_files.values())}")
 
-                for node_id, files in output_files.items():
-                    for file_info in files:
-                        filename = file_info['filename']
-                        save_path = os.path.join(output_dir, filename)
-
-                        if self.download_file(file_info, save_path):
-                            print(f"文件已保存: {save_path}")
+                downloads = [(file_info, os.path.join(output_dir, file_info['filename']))
+                             for files in output_files.values() for file_info in files]
+                for (_, save_path), ok in zip(downloads, self._download_all(downloads)):
+                    if ok:
+                        logger.info(f"文件已保存: {save_path}")
 
             return prompt_id
 
         except Exception as e:
-            print(f"工作流执行异常: {e}")
+            logger.info(f"工作流执行异常: {e}")
             return None
         finally:
             self.disconnect()
+            flush_console()
 
     def get_result_by_prompt_id(self, prompt_id: str, output_dir: str = "outputs") -> bool:
         """
@@ -701,98 +1025,227 @@ class DigitalHumanWorkflowClient:
 
         try:
             # 直接获取结果，不需要等待（任务已完成）
-            print(f"获取执行结果，Prompt ID: {prompt_id}")
+            logger.info(f"获取执行结果，Prompt ID: {prompt_id}")
             result = self.get_results(prompt_id)
             if not result:
-                print("获取结果失败")
+                logger.info("获取结果失败")
                 return False
 
-            print(f"结果数据: {result.keys() if result else 'None'}")
+            logger.info(f"结果数据: {result.keys() if result else 'None'}")
             
             # 显示详细的outputs结构
             if 'outputs' in result:
                 outputs = result['outputs']
-                print(f"Outputs 结构: {outputs.keys() if outputs else 'Empty'}")
+                logger.info(f"Outputs 结构: {outputs.keys() if outputs else 'Empty'}")
                 for node_id, node_output in outputs.items():
-                    print(f"节点 {node_id}: {list(node_output.keys())}")
+                    logger.info(f"节点 {node_id}: {list(node_output.keys())}")
                     if 'videos' in node_output:
-                        print(f"  - videos: {node_output['videos']}")
+                        logger.info(f"  - videos: {node_output['videos']}")
                     if 'audios' in node_output:
-                        print(f"  - audios: {node_output['audios']}")
+                        logger.info(f"  - audios: {node_output['audios']}")
                     if 'images' in node_output:
-                        print(f"  - images: {node_output['images']}")
+                        logger.info(f"  - images: {node_output['images']}")
                     if 'gifs' in node_output:
-                        print(f"  - gifs: {node_output['gifs']}")
+                        logger.info(f"  - gifs: {node_output['gifs']}")
             else:
-                print("Result 中没有 'outputs' 字段")
+                logger.info("Result 中没有 'outputs' 字段")
 
             # 提取并下载输出文件
             output_files = self.extract_output_files(result)
-            print(f"提取到的输出文件: {output_files}")
+            logger.info(f"提取到的输出文件: {output_files}")
             
             if output_files:
-                print(f"生成文件数量: {sum(len(files) for files in output_files.values())}")
+                logger.info(f"生成文件数量: {sum(len(files) for files in output_files.values())}")
 
                 video_files = []
                 audio_files = []
                 image_files = []
                 gif_files = []
                 
+                downloads = []
                 for node_id, files in output_files.items():
-                    print(f"节点 {node_id} 的输出文件: {len(files)}个")
+                    logger.info(f"节点 {node_id} 的输出文件: {len(files)}个")
                     for file_info in files:
-                        filename = file_info['filename']
-                        file_type = file_info['type']
-                        save_path = os.path.join(output_dir, filename)
-                        
-                        print(f"下载 {file_type} 文件: {filename}")
-                        if self.download_file(file_info, save_path):
-                            print(f"文件已保存: {save_path}")
-                            if file_type == 'video':
-                                video_files.append(save_path)
-                            elif file_type == 'audio':
-                                audio_files.append(save_path)
-                            elif file_type == 'image':
-                                image_files.append(save_path)
-                            elif file_type == 'gif':
-                                gif_files.append(save_path)
-                        else:
-                            print(f"文件下载失败: {filename}")
+                        logger.info(f"下载 {file_info['type']} 文件: {file_info['filename']}")
+                        downloads.append((file_info, os.path.join(output_dir, file_info['filename'])))
+
+                # 所有文件并发下载，总耗时取决于最慢的文件而不是耗时之和
+                for (file_info, save_path), ok in zip(downloads, self._download_all(downloads)):
+                    file_type = file_info['type']
+                    if ok:
+                        logger.info(f"文件已保存: {save_path}")
+                        if file_type == 'video':
+                            video_files.append(save_path)
+                        elif file_type == 'audio':
+                            audio_files.append(save_path)
+                        elif file_type == 'image':
+                            image_files.append(save_path)
+                        elif file_type == 'gif':
+                            gif_files.append(save_path)
+                    else:
+                        logger.info(f"文件下载失败: {file_info['filename']}")
 
                 if video_files:
-                    print(f"\n🎥 视频文件生成完成！")
+                    logger.info(f"\n🎥 视频文件生成完成！")
                     for video_file in video_files:
-                        print(f"  - {video_file}")
+                        logger.info(f"  - {video_file}")
                         
                 if audio_files:
-                    print(f"\n🎧 音频文件生成完成！")
+                    logger.info(f"\n🎧 音频文件生成完成！")
                     for audio_file in audio_files:
-                        print(f"  - {audio_file}")
+                        logger.info(f"  - {audio_file}")
                         
                 if image_files:
-                    print(f"\n🖼️ 图片文件生成完成！")
+                    logger.info(f"\n🖼️ 图片文件生成完成！")
                     for image_file in image_files:
-                        print(f"  - {image_file}")
+                        logger.info(f"  - {image_file}")
                         
                 if gif_files:
-                    print(f"\n🎉 GIF动图文件生成完成！")
+                    logger.info(f"\n🎉 GIF动图文件生成完成！")
                     for gif_file in gif_files:
-                        print(f"  - {gif_file}")
+                        logger.info(f"  - {gif_file}")
                         
                 if not (video_files or audio_files or image_files or gif_files):
-                    print("\n⚠️ 未找到任何可下载的文件")
+                    logger.info("\n⚠️ 未找到任何可下载的文件")
             else:
-                print("\n⚠️ 未找到任何输出文件")
+                logger.info("\n⚠️ 未找到任何输出文件")
 
             return True
 
         except Exception as e:
-            print(f"获取结果异常: {e}")
+            logger.info(f"获取结果异常: {e}")
             return False
         finally:
             self.disconnect()
 
 
+DEFAULT_SOCKET_PATH = "/tmp/dh_workflow.sock"
+
+
+def _daemon_is_running(socket_path: str) -> bool:
+    """检查socket上是否已有常驻服务在监听（能连上即视为存活）"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def serve_daemon(client: DigitalHumanWorkflowClient, workflow_path: str,
+                 defaults: Dict[str, Any], socket_path: str = DEFAULT_SOCKET_PATH) -> bool:
+    """
+    常驻服务模式：保持客户端和已解析的工作流在内存中，通过Unix socket接收任务
+
+    每行一个JSON请求，例如 {"audio": ..., "video": ..., "text": ...}，
+    未提供的字段使用 defaults 中的值。每个请求返回一行JSON结果。
+    任务按顺序执行（客户端只有一个WebSocket连接）。
+
+    Args:
+        client: 工作流客户端
+        workflow_path: 工作流配置文件路径
+        defaults: 请求字段的默认值
+        socket_path: Unix socket路径
+
+    Returns:
+        服务是否正常启动
+    """
+    if _daemon_is_running(socket_path):
+        logger.info(f"常驻服务已在运行: {socket_path}")
+        return False
+
+    if not client.load_workflow(workflow_path):
+        return False
+    # 常驻的是工作流文件的原始字节，每个任务重新解析出独立的字典
+    workflow_bytes = _read_workflow_bytes(workflow_path, os.stat(workflow_path).st_mtime_ns)
+
+    async def handle_job(job: Dict[str, Any]) -> Dict[str, Any]:
+        params = {**defaults, **job}
+        loop = asyncio.get_running_loop()
+        prompt_id = await loop.run_in_executor(None, lambda: client.run_workflow(
+            workflow_path=workflow_path,
+            audio_path=params.get('audio'),
+            video_path=params.get('video'),
+            text_prompt=params.get('text'),
+            positive_prompt=params.get('positive'),
+            negative_prompt=params.get('negative', ""),
+            output_dir=params.get('output', "outputs"),
+            # update_workflow_parameters 会修改嵌套节点，每个任务使用独立解析的字典
+            workflow=_loads(workflow_bytes)
+        ))
+        return {"ok": prompt_id is not None, "prompt_id": prompt_id}
+
+    async def main_loop():
+        job_lock = asyncio.Lock()
+
+        async def handle_connection(reader, writer):
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        job = json.loads(line)
+                        if not isinstance(job, dict):
+                            raise ValueError("请求必须是JSON对象")
+                    except ValueError as e:
+                        response = {"ok": False, "error": f"无效请求: {e}"}
+                    else:
+                        async with job_lock:
+                            response = await handle_job(job)
+                    writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+                    await writer.drain()
+            finally:
+                writer.close()
+
+        # 启动前已确认没有存活的服务，残留的socket文件可以安全删除
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+        logger.info(f"🛰️ 常驻服务已启动: {socket_path}")
+        flush_console()
+
+        # 收到SIGTERM时正常退出，确保socket文件被清理
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    try:
+        asyncio.run(main_loop())
+    except KeyboardInterrupt:
+        pass
+    logger.info("\n常驻服务已停止")
+    return True
+
+
+def submit_to_daemon(job: Dict[str, Any], socket_path: str = DEFAULT_SOCKET_PATH) -> Optional[Dict[str, Any]]:
+    """
+    向常驻服务提交一个任务并等待结果
+
+    Args:
+        job: 任务参数 (audio, video, text, positive, negative, output)
+        socket_path: Unix socket路径
+
+    Returns:
+        服务返回的结果，连接失败返回None
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(job, ensure_ascii=False).encode('utf-8') + b"\n")
+            with sock.makefile('rb') as stream:
+                line = stream.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError) as e:
+        logger.info(f"提交到常驻服务失败: {e}")
+        return None
+
+
 def main():
     """主函数 - 支持命令行参数"""
     parser = argparse.ArgumentParser(description="数字人生成工作流客户端")
@@ -821,95 +1274,138 @@ def main():
                        help="超时时间（秒），默认600秒")
     parser.add_argument("--no_download", action="store_true",
                        help="monitor模式下不自动下载结果")
+    parser.add_argument("--daemon", action="store_true",
+                       help="以常驻服务方式运行，通过Unix socket接收任务")
+    parser.add_argument("--submit", action="store_true",
+                       help="将任务提交给已运行的常驻服务")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                       help=f"常驻服务的Unix socket路径，默认{DEFAULT_SOCKET_PATH}")
 
     args = parser.parse_args()
 
-    # 创建客户端
-    client = DigitalHumanWorkflowClient(server_address=args.server)
-
-    if args.mode == "run":
-        # 运行工作流模式
-        print("=== 开始运行数字人生成工作流 ===")
-        print(f"工作流配置: {args.workflow}")
-        print(f"音频文件: {args.audio}")
-        print(f"图像文件: {args.video}")
-        print(f"文本提示: {args.text}")
-        print(f"正面提示词: {args.positive}")
-        print(f"负面提示词: {args.negative}")
-        print(f"输出目录: {args.output}")
-        print(f"超时时间: {args.timeout}秒")
-        print("=" * 50)
-
-        prompt_id = client.run_workflow(
-            workflow_path=args.workflow,
-            audio_path=args.audio,
-            video_path=args.video,
-            text_prompt=args.text,
-            positive_prompt=args.positive,
-            negative_prompt=args.negative,
-            output_dir=args.output
-        )
-
-        if prompt_id:
-            print(f"\n✅ 数字人生成完成！")
-            print(f"🎯 Prompt ID: {prompt_id}")
-            print(f"💾 输出目录: {args.output}")
-            print(f"\n💡 其他可用命令：")
-            print(f"  • 重新获取结果: python run_workflow.py --mode get_result --prompt_id {prompt_id}")
-            print(f"  • 仅监控进度: python run_workflow.py --mode monitor --prompt_id {prompt_id}")
+    # 控制台输出改为块缓冲，由 flush_console() 在阶段边界统一刷新
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(line_buffering=False)
+
+    job = {
+        "audio": args.audio,
+        "video": args.video,
+        "text": args.text,
+        "positive": args.positive,
+        "negative": args.negative,
+        "output": args.output
+    }
+
+    if args.submit:
+        # 提交到常驻服务（常驻服务的工作目录可能不同，路径转为绝对路径）
+        for key in ("audio", "video", "output"):
+            if job[key]:
+                job[key] = os.path.abspath(job[key])
+        response = submit_to_daemon(job, args.socket)
+        if response and response.get('ok'):
+            logger.info(f"✅ 数字人生成完成！Prompt ID: {response['prompt_id']}")
         else:
-            print("\n❌ 数字人生成失败！")
-
-    elif args.mode == "get_result":
-        # 获取结果模式
-        if not args.prompt_id:
-            print("❌ 错误：get_result模式需要提供 --prompt_id 参数")
+            logger.info(f"❌ 数字人生成失败！{response.get('error', '') if response else ''}")
+        return
+
+    # 创建客户端（退出时关闭连接和HTTP会话）
+    with DigitalHumanWorkflowClient(server_address=args.server) as client:
+        if args.daemon:
+            # 常驻服务模式
+            logger.info("=== 启动数字人生成常驻服务 ===")
+            logger.info(f"工作流配置: {args.workflow}")
+            logger.info(f"Socket路径: {args.socket}")
+            logger.info("=" * 50)
+            flush_console()
+            serve_daemon(client, args.workflow, job, args.socket)
             return
 
-        print("=== 获取数字人生成结果 ===")
-        print(f"Prompt ID: {args.prompt_id}")
-        print(f"输出目录: {args.output}")
-        print(f"超时时间: {args.timeout}秒")
-        print("=" * 50)
-
-        success = client.get_result_by_prompt_id(
-            prompt_id=args.prompt_id,
-            output_dir=args.output
-        )
-
-        if success:
-            print(f"\n✅ 结果获取完成！")
-            print(f"💾 输出目录: {args.output}")
-        else:
-            print(f"\n❌ 结果获取失败！")
+        if args.mode == "run":
+            # 运行工作流模式
+            logger.info("=== 开始运行数字人生成工作流 ===")
+            logger.info(f"工作流配置: {args.workflow}")
+            logger.info(f"音频文件: {args.audio}")
+            logger.info(f"图像文件: {args.video}")
+            logger.info(f"文本提示: {args.text}")
+            logger.info(f"正面提示词: {args.positive}")
+            logger.info(f"负面提示词: {args.negative}")
+            logger.info(f"输出目录: {args.output}")
+            logger.info(f"超时时间: {args.timeout}秒")
+            logger.info("=" * 50)
+            flush_console()
+
+            prompt_id = client.run_workflow(
+                workflow_path=args.workflow,
+                audio_path=args.audio,
+                video_path=args.video,
+                text_prompt=args.text,
+                positive_prompt=args.positive,
+                negative_prompt=args.negative,
+                output_dir=args.output
+            )
 
-    elif args.mode == "monitor":
-        # 仅监控进度模式
-        if not args.prompt_id:
-            print("❌ 错误：monitor模式需要提供 --prompt_id 参数")
-            return
+            if prompt_id:
+                logger.info(f"\n✅ 数字人生成完成！")
+                logger.info(f"🎯 Prompt ID: {prompt_id}")
+                logger.info(f"💾 输出目录: {args.output}")
+                logger.info(f"\n💡 其他可用命令：")
+                logger.info(f"  • 重新获取结果: python run_workflow.py --mode get_result --prompt_id {prompt_id}")
+                logger.info(f"  • 仅监控进度: python run_workflow.py --mode monitor --prompt_id {prompt_id}")
+            else:
+                logger.info("\n❌ 数字人生成失败！")
+
+        elif args.mode == "get_result":
+            # 获取结果模式
+            if not args.prompt_id:
+                logger.info("❌ 错误：get_result模式需要提供 --prompt_id 参数")
+                return
+
+            logger.info("=== 获取数字人生成结果 ===")
+            logger.info(f"Prompt ID: {args.prompt_id}")
+            logger.info(f"输出目录: {args.output}")
+            logger.info(f"超时时间: {args.timeout}秒")
+            logger.info("=" * 50)
+            flush_console()
+
+            success = client.get_result_by_prompt_id(
+                prompt_id=args.prompt_id,
+                output_dir=args.output
+            )
 
-        print("=== 监控数字人生成进度 ===")
-        print(f"Prompt ID: {args.prompt_id}")
-        print(f"超时时间: {args.timeout}秒")
-        print("🔍 正在连接服务器并监控任务进度...")
-        print("=" * 50)
-
-        success = client.monitor_progress_only(
-            prompt_id=args.prompt_id,
-            timeout=args.timeout,
-            auto_download=not args.no_download,
-            output_dir=args.output
-        )
+            if success:
+                logger.info(f"\n✅ 结果获取完成！")
+                logger.info(f"💾 输出目录: {args.output}")
+            else:
+                logger.info(f"\n❌ 结果获取失败！")
+
+        elif args.mode == "monitor":
+            # 仅监控进度模式
+            if not args.prompt_id:
+                logger.info("❌ 错误：monitor模式需要提供 --prompt_id 参数")
+                return
+
+            logger.info("=== 监控数字人生成进度 ===")
+            logger.info(f"Prompt ID: {args.prompt_id}")
+            logger.info(f"超时时间: {args.timeout}秒")
+            logger.info("🔍 正在连接服务器并监控任务进度...")
+            logger.info("=" * 50)
+            flush_console()
+
+            success = client.monitor_progress_only(
+                prompt_id=args.prompt_id,
+                timeout=args.timeout,
+                auto_download=not args.no_download,
+                output_dir=args.output
+            )
 
-        if success:
-            if args.no_download:
-                print(f"\n✅ 监控完成！任务已成功执行。")
-                print(f"💡 如需下载结果，请运行: python run_workflow.py --mode get_result --prompt_id {args.prompt_id}")
+            if success:
+                if args.no_download:
+                    logger.info(f"\n✅ 监控完成！任务已成功执行。")
+                    logger.info(f"💡 如需下载结果，请运行: python run_workflow.py --mode get_result --prompt_id {args.prompt_id}")
+                else:
+                    logger.info(f"\n🎉 监控和下载全部完成！")
             else:
-                print(f"\n🎉 监控和下载全部完成！")
-        else:
-            print(f"\n❌ 监控结束！任务可能失败或超时。")
+                logger.info(f"\n❌ 监控结束！任务可能失败或超时。")
 
 
 if __name__ == "__main__":
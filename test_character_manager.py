@@ -3,12 +3,12 @@
 """
 
 import unittest
-import tempfile
 import shutil
 import os
 import json
+import time
 from pathlib import Path
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import patch
 
 from character_models import (
     CharacterInfo, ValidationResult, CharacterError,
@@ -19,14 +19,15 @@ from character_models import (
 )
 
 from character_manager_core import CharacterManager, CacheEntry
+from testing_utils import ClassTempDirMixin
 
 
-class TestCharacterModels(unittest.TestCase):
+class TestCharacterModels(ClassTempDirMixin, unittest.TestCase):
     """测试数据模型和工具函数"""
     
     def setUp(self):
         """测试前准备"""
-        self.temp_dir = tempfile.mkdtemp()
+        self.temp_dir = self.make_test_dir()
         self.test_audio = os.path.join(self.temp_dir, "test.mp3")
         self.test_image = os.path.join(self.temp_dir, "test.jpg")
         
@@ -36,10 +37,6 @@ class TestCharacterModels(unittest.TestCase):
         with open(self.test_image, 'w') as f:
             f.write("test image content")
     
-    def tearDown(self):
-        """测试后清理"""
-        shutil.rmtree(self.temp_dir)
-    
     def test_character_info_creation(self):
         """测试角色信息创建"""
         character = CharacterInfo(
@@ -138,6 +135,25 @@ class TestCharacterModels(unittest.TestCase):
         self.assertIn("negative_prompt", default_config)
         self.assertIn("workflow_params", default_config)
     
+    def test_load_config_cache(self):
+        """测试配置缓存：返回独立副本，文件修改后重新加载"""
+        config_path = os.path.join(self.temp_dir, "config.json")
+        with open(config_path, 'w') as f:
+            json.dump({"positive_prompt": "v1", "tags": ["a"]}, f)
+        
+        first = CharacterConfig.load_config(self.temp_dir)
+        first["tags"].append("b")
+        self.assertEqual(CharacterConfig.load_config(self.temp_dir)["tags"], ["a"])
+        
+        # 文件内容变化后缓存失效
+        with open(config_path, 'w') as f:
+            json.dump({"positive_prompt": "version2"}, f)
+        self.assertEqual(CharacterConfig.load_config(self.temp_dir)["positive_prompt"], "version2")
+        
+        # save_config 写入后立即可见
+        CharacterConfig.save_config(self.temp_dir, {"positive_prompt": "v3"})
+        self.assertEqual(CharacterConfig.load_config(self.temp_dir)["positive_prompt"], "v3")
+    
     def test_file_validation_functions(self):
         """测试文件验证函数"""
         self.assertTrue(is_valid_audio_file("test.mp3"))
@@ -151,6 +167,11 @@ class TestCharacterModels(unittest.TestCase):
         self.assertTrue(is_valid_video_file("test.mp4"))
         self.assertTrue(is_valid_video_file("test.avi"))
         self.assertFalse(is_valid_video_file("test.txt"))
+        
+        # 扩展名大小写不敏感，隐藏文件和目录名中的点不算扩展名
+        self.assertTrue(is_valid_audio_file("TEST.MP3"))
+        self.assertFalse(is_valid_audio_file(".mp3"))
+        self.assertFalse(is_valid_image_file(os.path.join("dir.png", "file")))
     
     def test_sanitize_character_name(self):
         """测试角色名称清理"""
@@ -175,12 +196,12 @@ class TestCharacterModels(unittest.TestCase):
         self.assertEqual(size_mb, 0.0)
 
 
-class TestCharacterManager(unittest.TestCase):
+class TestCharacterManager(ClassTempDirMixin, unittest.TestCase):
     """测试角色管理器"""
     
     def setUp(self):
         """测试前准备"""
-        self.temp_dir = tempfile.mkdtemp()
+        self.temp_dir = self.make_test_dir()
         self.characters_dir = os.path.join(self.temp_dir, "characters")
         self.manager = CharacterManager(self.characters_dir)
         
@@ -197,10 +218,6 @@ class TestCharacterManager(unittest.TestCase):
         with open(self.test_image, 'w') as f:
             f.write("test image content")
     
-    def tearDown(self):
-        """测试后清理"""
-        shutil.rmtree(self.temp_dir)
-    
     def test_ensure_characters_dir(self):
         """测试确保角色目录存在"""
         # 删除目录
@@ -221,6 +238,7 @@ class TestCharacterManager(unittest.TestCase):
         self.assertTrue(result.has_images())
         self.assertIn(self.test_audio, result.found_files['audio'])
         self.assertIn(self.test_image, result.found_files['images'])
+        self.assertEqual(result.file_sizes[self.test_audio], len("test audio content"))
     
     def test_validate_character_not_found(self):
         """测试角色不存在"""
@@ -289,6 +307,19 @@ class TestCharacterManager(unittest.TestCase):
         """测试检查角色是否存在"""
         self.assertTrue(self.manager.character_exists("test_char"))
     
+    def test_get_character_summary_dict(self):
+        """测试获取结构化角色摘要"""
+        summary = self.manager.get_character_summary_dict("test_char")
+        
+        self.assertEqual(summary['name'], "test_char")
+        self.assertEqual(summary['audio'], self.test_audio)
+        self.assertEqual(summary['visual'], self.test_image)
+        self.assertEqual(summary['visual_type'], 'image')
+        self.assertTrue(summary['valid'])
+        
+        # 不存在的角色
+        self.assertIsNone(self.manager.get_character_summary_dict("nonexistent"))
+    
     def test_get_character_summary(self):
         """测试获取角色摘要"""
         summary = self.manager.get_character_summary("test_char")
@@ -315,6 +346,96 @@ class TestCharacterManager(unittest.TestCase):
         character3 = self.manager.load_character("test_char")
         self.assertIsNot(character1, character3)
     
+    def test_concurrent_load_scans_once(self):
+        """测试多个线程同时加载同一角色时只扫描一次磁盘"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        original_scan = self.manager._scan_and_build
+        
+        def slow_scan(name, **kwargs):
+            time.sleep(0.05)  # 放大竞争窗口
+            return original_scan(name, **kwargs)
+        
+        with patch.object(self.manager, '_scan_and_build', side_effect=slow_scan) as scan:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                characters = list(executor.map(self.manager.load_character, ["test_char"] * 16))
+        
+        self.assertEqual(scan.call_count, 1)
+        self.assertTrue(all(c is characters[0] for c in characters))
+    
+    def test_negative_cache(self):
+        """测试验证失败的结果被缓存，角色目录变化后失效"""
+        os.remove(self.test_audio)
+        
+        with patch.object(self.manager, '_scan_and_build', wraps=self.manager._scan_and_build) as scan:
+            for _ in range(3):
+                with self.assertRaises(CharacterValidationError):
+                    self.manager.load_character("test_char")
+            self.assertFalse(self.manager.character_exists("test_char"))
+            self.assertEqual(scan.call_count, 1)
+        self.assertEqual(self.manager.get_cache_stats()['negative_entries'], 1)
+        
+        # 补充音频文件后重新扫描（显式更新目录时间，部分文件系统时间戳精度较粗）
+        with open(self.test_audio, 'w') as f:
+            f.write("test audio content")
+        stat = os.stat(self.test_character_dir)
+        os.utime(self.test_character_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        
+        self.assertTrue(self.manager.character_exists("test_char"))
+        self.assertEqual(self.manager.load_character("test_char").audio_path, self.test_audio)
+    
+    def test_cache_invalidated_when_character_dir_changes(self):
+        """测试加载成功后删除音频文件，缓存失效，角色不再存在"""
+        self.assertTrue(self.manager.character_exists("test_char"))
+        
+        # 显式更新目录时间，部分文件系统时间戳精度较粗
+        os.remove(self.test_audio)
+        stat = os.stat(self.test_character_dir)
+        os.utime(self.test_character_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        
+        self.assertFalse(self.manager.character_exists("test_char"))
+        with self.assertRaises(CharacterValidationError):
+            self.manager.load_character("test_char")
+    
+    def test_cold_load_stats_character_dir_once(self):
+        """测试首次加载只 stat 一次角色目录（负缓存的目录时间取自同一次 stat）"""
+        os.remove(self.test_audio)
+        
+        with patch('character_manager_core.os.stat', wraps=os.stat) as mock_stat:
+            with self.assertRaises(CharacterValidationError):
+                self.manager.load_character("test_char")
+        
+        character_dir = os.path.abspath(self.test_character_dir)
+        dir_stats = [c for c in mock_stat.call_args_list if os.path.abspath(c.args[0]) == character_dir]
+        self.assertEqual(len(dir_stats), 1)
+        
+        entry = next(iter(self.manager.cache.values()))
+        self.assertEqual(entry.dir_mtime_ns, os.stat(self.test_character_dir).st_mtime_ns)
+    
+    def test_warmup_all_reuses_dir_entries(self):
+        """测试预热只扫描一次根目录，并复用目录条目的stat结果"""
+        os.makedirs(os.path.join(self.characters_dir, "empty_char"))
+        os.makedirs(os.path.join(self.characters_dir, ".hidden"))
+        
+        with patch('character_manager_core.os.stat', wraps=os.stat) as mock_stat, \
+                patch('character_manager_core.os.scandir', wraps=os.scandir) as mock_scandir:
+            self.assertEqual(self.manager.warmup_all(), 1)
+        
+        # 根目录只 stat 一次，角色目录不再单独 stat（配置文件的 stat 不计）
+        stat_paths = [os.path.abspath(c.args[0]) for c in mock_stat.call_args_list]
+        self.assertEqual(stat_paths.count(os.path.abspath(self.characters_dir)), 1)
+        for name in ("test_char", "empty_char"):
+            self.assertNotIn(os.path.abspath(os.path.join(self.characters_dir, name)), stat_paths)
+        root_scans = [c for c in mock_scandir.call_args_list if c.args[0] == self.characters_dir]
+        self.assertEqual(len(root_scans), 1)
+        
+        # 有效角色和验证失败的角色都进入缓存，隐藏目录被跳过
+        stats = self.manager.get_cache_stats()
+        self.assertEqual(stats['total_entries'], 2)
+        self.assertEqual(stats['negative_entries'], 1)
+        self.assertIs(self.manager.load_character("test_char"),
+                      self.manager.load_character("test_char"))
+    
     def test_cache_stats(self):
         """测试缓存统计"""
         # 加载角色以填充缓存
@@ -335,54 +456,77 @@ class TestCharacterManager(unittest.TestCase):
         with self.assertRaises(CharacterError):
             self.manager._sanitize_path("..\\..\\windows\\system32")
     
-    def test_find_files_by_type(self):
-        """测试按类型查找文件"""
-        # 在测试目录中查找音频文件
-        audio_files = self.manager._find_files_by_type(
-            self.test_character_dir, 
-            {'.mp3', '.wav'}
-        )
-        
-        self.assertIn(self.test_audio, audio_files)
-        self.assertEqual(len(audio_files), 1)
-        
-        # 查找不存在的文件类型
-        txt_files = self.manager._find_files_by_type(
-            self.test_character_dir,
-            {'.txt'}
-        )
-        
-        self.assertEqual(len(txt_files), 0)
+    def test_classify_dir(self):
+        """测试单次扫描按类型分组"""
+        test_video = os.path.join(self.test_character_dir, "clip.MP4")
+        with open(test_video, 'w') as f:
+            f.write("video")
+        with open(os.path.join(self.test_character_dir, "notes.txt"), 'w') as f:
+            f.write("ignored")
+        
+        classified = self.manager._classify_dir(self.test_character_dir)
+        
+        self.assertEqual(classified['audio'], [(self.test_audio, len("test audio content"))])
+        self.assertEqual(classified['images'], [(self.test_image, len("test image content"))])
+        self.assertEqual(classified['videos'], [(test_video, len("video"))])  # 扩展名不区分大小写，.txt 被忽略
+        
+        # 不存在的目录返回空分组
+        empty = self.manager._classify_dir(os.path.join(self.temp_dir, "missing"))
+        self.assertEqual(empty, {'audio': [], 'images': [], 'videos': []})
+
+
+class FakeClock:
+    """可手动推进的时钟，用于测试缓存过期"""
+    
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += seconds
 
 
 class TestCacheEntry(unittest.TestCase):
     """测试缓存条目"""
     
+    def setUp(self):
+        """测试前准备"""
+        self.clock = FakeClock()
+        self.character = CharacterInfo(
+            name="test_char",
+            audio_path="test.mp3",
+            visual_path="test.jpg",
+            visual_type="image"
+        )
+    
     def test_cache_entry_creation(self):
         """测试缓存条目创建"""
-        import time
-        character = Mock(spec=CharacterInfo)
-        entry = CacheEntry(character, time.time())
+        entry = CacheEntry(self.character, self.clock(), clock=self.clock)
         
-        self.assertEqual(entry.character_info, character)
+        self.assertIs(entry.character_info, self.character)
         self.assertFalse(entry.is_expired())
     
     def test_cache_entry_expiration(self):
         """测试缓存条目过期"""
-        import time
-        character = Mock(spec=CharacterInfo)
-        old_time = time.time() - 400  # 400秒前
-        entry = CacheEntry(character, old_time, ttl=300)  # 5分钟TTL
+        entry = CacheEntry(self.character, self.clock(), ttl=300, clock=self.clock)  # 5分钟TTL
+        self.clock.advance(400)  # 400秒后
         
         self.assertTrue(entry.is_expired())
     
     def test_cache_entry_not_expired(self):
         """测试缓存条目未过期"""
-        import time
-        character = Mock(spec=CharacterInfo)
-        recent_time = time.time() - 60  # 60秒前
-        entry = CacheEntry(character, recent_time, ttl=300)  # 5分钟TTL
+        entry = CacheEntry(self.character, self.clock(), ttl=300, clock=self.clock)  # 5分钟TTL
+        self.clock.advance(60)  # 60秒后
+        
+        self.assertFalse(entry.is_expired())
+    
+    def test_cache_entry_default_clock_is_monotonic(self):
+        """测试默认使用单调时钟"""
+        entry = CacheEntry(self.character, time.monotonic())
         
+        self.assertIs(entry.clock, time.monotonic)
         self.assertFalse(entry.is_expired())
 
 
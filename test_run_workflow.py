@@ -0,0 +1,149 @@
+"""
+数字人生成工作流客户端 - 单元测试
+"""
+
+import unittest
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import subprocess
+import textwrap
+
+import websocket
+
+import run_workflow
+from testing_utils import ClassTempDirMixin
+
+
+# 在子进程中运行常驻服务：信号处理只能在主线程注册，run_workflow 用桩实现代替真实生成
+_DAEMON_SCRIPT = textwrap.dedent('''
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    import run_workflow
+
+    class StubClient(run_workflow.DigitalHumanWorkflowClient):
+        def run_workflow(self, **params):
+            workflow = params['workflow']
+            fresh = '_used' not in workflow
+            workflow['_used'] = True  # 模拟 update_workflow_parameters 原地修改工作流
+            return 'fresh' if fresh else 'reused'
+
+    ok = run_workflow.serve_daemon(StubClient('127.0.0.1:1'), sys.argv[2], {}, sys.argv[3])
+    sys.exit(0 if ok else 3)
+''')
+
+
+class _FakeWebSocket:
+    """WebSocket桩：socket始终可读，recv 依次返回预设消息"""
+
+    def __init__(self, messages):
+        self.sock, self._peer = socket.socketpair()
+        self._peer.send(b"x")  # 让 selector 立即报告可读
+        self._messages = list(messages)
+        self.closed = False
+
+    def recv(self):
+        return self._messages.pop(0)
+
+    def close(self):
+        self.closed = True
+        if self.sock is not None:
+            self.sock.close()
+        self._peer.close()
+
+
+class _DroppedWebSocket(_FakeWebSocket):
+    """连接被服务器关闭的WebSocket：与 websocket-client 一样先把 sock 置为None再抛出异常"""
+
+    def __init__(self):
+        super().__init__([])
+
+    def recv(self):
+        self.sock.close()
+        self.sock = None
+        raise websocket.WebSocketConnectionClosedException("Connection to remote host was lost.")
+
+
+class TestWaitForCompletion(unittest.TestCase):
+    """测试等待任务完成"""
+
+    def test_reconnect_after_connection_dropped(self):
+        """测试连接断开后重新连接并继续等待"""
+        client = run_workflow.DigitalHumanWorkflowClient("127.0.0.1:1")
+        self.addCleanup(client.close)
+        dropped = _DroppedWebSocket()
+        reconnected = _FakeWebSocket([
+            json.dumps({"type": "executing", "data": {"prompt_id": "p1", "node": None}})
+        ])
+        client.ws = dropped
+
+        connect_calls = []
+
+        def fake_connect():
+            connect_calls.append(1)
+            client.ws = reconnected
+            return True
+
+        client.connect = fake_connect
+
+        self.assertTrue(client.wait_for_completion("p1", timeout=10, show_progress=False))
+        self.assertEqual(len(connect_calls), 1)
+        self.assertTrue(dropped.closed)
+        reconnected.close()
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "常驻服务需要Unix socket")
+class TestDaemon(ClassTempDirMixin, unittest.TestCase):
+    """测试常驻服务模式"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = self.make_test_dir()
+        self.socket_path = os.path.join(self.temp_dir, "daemon.sock")
+        self.workflow_path = os.path.join(self.temp_dir, "workflow.json")
+        with open(self.workflow_path, 'w', encoding='utf-8') as f:
+            json.dump({"1": {"inputs": {"text": "hello"}, "class_type": "Text"}}, f)
+
+    def start_daemon(self) -> subprocess.Popen:
+        """启动常驻服务子进程"""
+        return subprocess.Popen(
+            [sys.executable, "-c", _DAEMON_SCRIPT,
+             os.path.dirname(os.path.abspath(run_workflow.__file__)), self.workflow_path, self.socket_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def wait_until_listening(self, process: subprocess.Popen, timeout: float = 10.0):
+        """等待常驻服务开始监听"""
+        deadline = time.monotonic() + timeout
+        while not run_workflow._daemon_is_running(self.socket_path):
+            self.assertIsNone(process.poll(), "常驻服务提前退出")
+            self.assertLess(time.monotonic(), deadline, "常驻服务启动超时")
+            time.sleep(0.02)
+
+    def test_daemon_lifecycle(self):
+        """测试重复启动被拒绝、每个任务使用新解析的工作流、SIGTERM后删除socket"""
+        daemon = self.start_daemon()
+        self.addCleanup(daemon.kill)
+        self.wait_until_listening(daemon)
+
+        # 同一路径上的第二个服务拒绝启动，不影响已运行的服务
+        second = self.start_daemon()
+        self.assertEqual(second.wait(timeout=10), 3)
+        self.assertIsNone(daemon.poll())
+
+        # 每个任务拿到的都是未被之前任务修改过的工作流
+        for _ in range(2):
+            response = run_workflow.submit_to_daemon({"text": "hi"}, self.socket_path)
+            self.assertEqual(response, {"ok": True, "prompt_id": "fresh"})
+
+        # SIGTERM 后正常退出并删除socket文件
+        daemon.send_signal(signal.SIGTERM)
+        self.assertEqual(daemon.wait(timeout=10), 0)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
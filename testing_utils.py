@@ -0,0 +1,33 @@
+"""
+数字人角色管理器 - 测试公用的临时目录工具
+"""
+
+import os
+import shutil
+import tempfile
+
+
+# 优先在内存文件系统（tmpfs）上创建测试目录，fixture 文件的读写不经过磁盘；
+# 显式设置了 TMPDIR 时以它为准
+_TEMP_ROOT = None if os.environ.get('TMPDIR') else (
+    '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+)
+
+
+def make_temp_dir() -> str:
+    """创建测试用临时目录（未设置 TMPDIR 时 Linux 上位于 /dev/shm，其他平台使用系统默认临时目录）"""
+    return tempfile.mkdtemp(prefix="dh_test_", dir=_TEMP_ROOT)
+
+
+class ClassTempDirMixin:
+    """整个测试类共用一个临时根目录，类结束时统一删除；每个测试在其中创建自己的目录"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.class_temp_dir = make_temp_dir()
+        cls.addClassCleanup(shutil.rmtree, cls.class_temp_dir, ignore_errors=True)
+
+    def make_test_dir(self) -> str:
+        """在类级根目录下为当前测试创建独立的临时目录"""
+        return tempfile.mkdtemp(dir=self.class_temp_dir)